@@ -0,0 +1,233 @@
+"""
+Configuration of data_analyser for unattended runs (cron, watch_folder, worker pools).
+
+The configuration is a JSON object in configs/analysis.json; every key is optional
+and missing keys take the values from DEFAULT_CONFIG:
+
+    {
+        "ratios": ["Meas A", "Meas B"],
+        "stats": ["Mean", "Std", "SEM"],
+        "output_formats": ["csv", "npz"],
+        "workers": 4,
+        "subdirs": null,
+        "interactive": false,
+        "write_merged": true,
+        "time_course": true,
+        "bootstrap_resamples": 10000,
+        "confidence_level": 0.95,
+        "bootstrap_seed": 42,
+        "normalization": [
+            {"control": "CAA_Spc", "apply_to": "*_CAA", "operation": "subtract"},
+            {"control": "CAA", "apply_to": "*_CAA", "operation": "divide", "measurements": ["Meas A"]}
+        ],
+        "spatial_correction": "median_polish",
+        "comparisons": [["1M_CAA", "2M_CAA"], ["1M_Glc", "2M_Glc"]],
+        "p_adjust": "holm",
+        "dose_response": true,
+        "qc": {"positive": "CAA", "negative": "CAA_Spc", "min_z_prime": 0.5, "max_cv": 20, "exclude": false}
+    }
+
+ratios – [numerator, denominator], a list of such pairs, "all" (every ordered
+pair of measurements, i.e. the full N x N ratio matrix), false (no ratios.csv)
+or null (ask the user when running interactively, otherwise skip).
+write_merged – false skips data_merged.csv; statistics then come from the
+per-plate partials alone and only new or changed plates are read.
+time_course – after the subdirectories, stack the summaries of the timepoint
+subdirectories (0h, 3h, ...) into time_course.csv and kinetics.csv (see time_course.py).
+bootstrap_resamples – number of bootstrap resamples of replicate wells (0 = off);
+when set, summary.csv gets CI_Low/CI_High of every mean and ratio mean at
+confidence_level (see bootstrap.py). bootstrap_seed makes the intervals reproducible.
+normalization – rules applied in order to every plate before any statistics: the mean
+of the control wells (Sample matching the "control" pattern) of the same plate and
+measurement is subtracted from, or divides, the wells matching "apply_to" (default "*"),
+optionally only for the listed measurements (see normalization.py).
+spatial_correction – null, "median_polish" or "bscore": removes row/column effects of
+every plate after normalization (see spatial.py).
+comparisons – null (no tests), "all" (every pair of samples) or a list of
+[sample, sample] pairs: Welch t-tests within each timepoint and measurement/ratio,
+plus a Welch ANOVA, written to significance.csv; p_adjust – "holm", "bh" or "none"
+(correction within each measurement/ratio, see significance.py).
+dose_response – null/false (off), true (sample names like "1M_CAA" = dose 1 of series
+"M_CAA") or a regular expression with the named groups "dose" and "series": fits
+4PL curves per series and writes dose_response.csv (see dose_response.py).
+qc – plate quality control after data generation (see plate_qc.py): Z'-factor, CVs
+and S/B of the positive/negative control wells (Sample patterns) of every plate and
+measurement, written to plate_qc.csv; "exclude": true leaves failed plates out of the analysis.
+Invalid values are logged and replaced by their defaults, so a broken file never stops a batch run.
+"""
+import json
+import os
+import re
+
+from logger_setup import logger
+
+CONFIG_DIR = 'configs'
+CONFIG_FILE = os.path.join(CONFIG_DIR, 'analysis.json')
+
+# Statistics that can be written next to every row: name -> group_stats.GroupStats field
+STAT_FIELDS = {
+    'N': 'count',
+    'Mean': 'mean',
+    'Std': 'std',
+    'SEM': 'sem',
+    'Min': 'min',
+    'Max': 'max',
+}
+OUTPUT_FORMATS = ('csv', 'npz')
+ALL_RATIOS = 'all'
+NORMALIZATION_OPERATIONS = ('subtract', 'divide')
+SPATIAL_METHODS = ('median_polish', 'bscore')
+P_ADJUST_METHODS = ('holm', 'bh', 'none')
+ALL_SAMPLE_PAIRS = 'all'
+
+DEFAULT_CONFIG = {
+    'ratios': None,
+    'stats': ['Mean', 'Std'],
+    'output_formats': ['csv'],
+    'workers': None,
+    'subdirs': None,
+    'interactive': True,
+    'write_merged': True,
+    'time_course': True,
+    'bootstrap_resamples': 0,
+    'confidence_level': 0.95,
+    'bootstrap_seed': None,
+    'normalization': None,
+    'spatial_correction': None,
+    'comparisons': None,
+    'p_adjust': 'holm',
+    'dose_response': None,
+    'qc': None,
+}
+
+
+def _is_string_list(value):
+    return isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value)
+
+
+def _is_pair(value):
+    return _is_string_list(value) and len(value) == 2
+
+
+def _validate_ratios(value):
+    if value is None or value is False or value == ALL_RATIOS or _is_pair(value):
+        return True
+    return isinstance(value, (list, tuple)) and bool(value) and all(_is_pair(v) for v in value)
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_normalization_rule(rule):
+    return (
+        isinstance(rule, dict)
+        and set(rule) <= {'control', 'apply_to', 'operation', 'measurements'}
+        and isinstance(rule.get('control'), str)
+        and isinstance(rule.get('apply_to', '*'), str)
+        and rule.get('operation') in NORMALIZATION_OPERATIONS
+        and _is_string_list(rule.get('measurements', []))
+    )
+
+
+def _is_dose_pattern(value):
+    if value is None or isinstance(value, bool):
+        return True
+    if not isinstance(value, str):
+        return False
+    try:
+        return {'dose', 'series'} <= set(re.compile(value).groupindex)
+    except re.error:
+        return False
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_qc(value):
+    if value is None:
+        return True
+    return (
+        isinstance(value, dict)
+        and set(value) <= {'positive', 'negative', 'min_z_prime', 'max_cv', 'exclude'}
+        and isinstance(value.get('positive'), str)
+        and isinstance(value.get('negative'), str)
+        and _is_number(value.get('min_z_prime', 0.5))
+        and (value.get('max_cv') is None or _is_number(value['max_cv']))
+        and isinstance(value.get('exclude', False), bool)
+    )
+
+
+# key -> predicate for valid values
+_VALIDATORS = {
+    'ratios': _validate_ratios,
+    'stats': lambda v: _is_string_list(v) and bool(v) and set(v) <= set(STAT_FIELDS),
+    'output_formats': lambda v: _is_string_list(v) and bool(v) and set(v) <= set(OUTPUT_FORMATS),
+    'workers': lambda v: v is None or _is_count(v),
+    'subdirs': lambda v: v is None or _is_string_list(v),
+    'interactive': lambda v: isinstance(v, bool),
+    'write_merged': lambda v: isinstance(v, bool),
+    'time_course': lambda v: isinstance(v, bool),
+    'bootstrap_resamples': _is_count,
+    'confidence_level': lambda v: _is_number(v) and 0 < v < 1,
+    'bootstrap_seed': lambda v: v is None or _is_count(v),
+    'normalization': lambda v: v is None or (isinstance(v, list) and all(_is_normalization_rule(r) for r in v)),
+    'spatial_correction': lambda v: v is None or v in SPATIAL_METHODS,
+    'comparisons': lambda v: v is None or v == ALL_SAMPLE_PAIRS or (
+        isinstance(v, (list, tuple)) and bool(v) and all(_is_pair(p) for p in v)),
+    'p_adjust': lambda v: v in P_ADJUST_METHODS,
+    'dose_response': _is_dose_pattern,
+    'qc': _is_qc,
+}
+
+
+def validate_config(values, source='konfiguracja'):
+    """
+    Return DEFAULT_CONFIG updated with the valid entries of values.
+    Unknown keys and invalid values are logged and ignored.
+    """
+    config = {key: (list(v) if isinstance(v, list) else v) for key, v in DEFAULT_CONFIG.items()}
+    for key, value in values.items():
+        if key not in _VALIDATORS:
+            logger.warning("Nieznany klucz '%s' w %s; pomijam.", key, source)
+            continue
+        if not _VALIDATORS[key](value):
+            logger.error("Niepoprawna wartość '%s' dla klucza '%s' w %s; używam domyślnej: %r",
+                         value, key, source, DEFAULT_CONFIG[key])
+            continue
+        config[key] = value
+    ratios = config['ratios']
+    if ratios and ratios != ALL_RATIOS:
+        # A single pair or a list of pairs -> list of (numerator, denominator) tuples
+        config['ratios'] = [tuple(ratios)] if _is_pair(ratios) else [tuple(pair) for pair in ratios]
+    return config
+
+
+def load_config(path=CONFIG_FILE):
+    """Load the analysis configuration from a JSON file; defaults when the file does not exist."""
+    if not os.path.exists(path):
+        return validate_config({})
+    try:
+        with open(path, encoding='utf-8') as f:
+            values = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("Nie udało się wczytać konfiguracji %s: %s; używam domyślnej.", path, e)
+        return validate_config({})
+    if not isinstance(values, dict):
+        logger.error("Konfiguracja %s nie jest obiektem JSON; używam domyślnej.", path)
+        return validate_config({})
+    logger.debug("Wczytano konfigurację analizy z %s", path)
+    return validate_config(values, path)
+
+
+def resolve_config(config=None):
+    """
+    Normalize the config argument of analyze_all: None loads CONFIG_FILE,
+    a string is a path to a JSON file and a dict overrides DEFAULT_CONFIG.
+    """
+    if config is None:
+        return load_config()
+    if isinstance(config, str):
+        return load_config(config)
+    return validate_config(config, 'argumentach')
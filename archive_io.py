@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dostęp do plików wejściowych bez rozpakowywania na dysk.
+
+Obsługiwane są:
+- zwykłe pliki (np. input/0h/1_11937.csv),
+- pliki skompresowane gzip (*.gz) i zstd (*.zst; wymaga pakietu zstandard),
+- pliki wewnątrz archiwów zip – ścieżka prowadzi "przez" archiwum, np.
+  input/runs.zip/0h/1_11937.csv albo input\\runs.zip\\0h\\1_11937.csv.gz.
+"""
+import gzip
+import io
+import os
+import zipfile
+
+try:
+    import zstandard
+except ImportError:  # zstd jest opcjonalny
+    zstandard = None
+
+ARCHIVE_SUFFIXES = ('.zip',)
+COMPRESSION_SUFFIXES = ('.gz', '.zst')
+
+
+def split_archive_path(path: str):
+    """
+    Dzieli ścieżkę na (ścieżka_archiwum_zip, nazwa_elementu_w_archiwum).
+    Zwraca (None, None), gdy żaden z katalogów ścieżki nie jest archiwum zip.
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    for idx in range(1, len(parts)):
+        prefix = os.sep.join(parts[:idx]) or os.sep
+        if prefix.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(prefix):
+            return prefix, '/'.join(parts[idx:])
+    return None, None
+
+
+def is_plain_file(path: str) -> bool:
+    """True dla zwykłego, nieskompresowanego pliku na dysku (np. nadającego się do mmap)."""
+    return not path.lower().endswith(COMPRESSION_SUFFIXES) and os.path.isfile(path)
+
+
+def input_exists(path: str) -> bool:
+    """Sprawdza, czy plik wejściowy istnieje – na dysku albo wewnątrz archiwum zip."""
+    if os.path.isfile(path):
+        return True
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return False
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            zf.getinfo(member)
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return False
+    return True
+
+
+def _decompress(stream, name: str):
+    """Nakłada dekompresję strumieniową zgodnie z rozszerzeniem nazwy pliku."""
+    lower = name.lower()
+    if lower.endswith('.gz'):
+        gz = gzip.GzipFile(fileobj=stream, mode='rb')
+        gz.myfileobj = stream  # GzipFile zamknie wtedy także strumień źródłowy
+        return gz
+    if lower.endswith('.zst'):
+        if zstandard is None:
+            stream.close()
+            raise OSError(f'Plik {name} wymaga pakietu zstandard (pip install zstandard)')
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+    return stream
+
+
+def open_input(path: str):
+    """
+    Otwiera plik wejściowy do strumieniowego czytania bajtów (bez rozpakowywania na dysk).
+    Zwraca obiekt plikowy w trybie binarnym; wywołujący odpowiada za jego zamknięcie.
+    """
+    if os.path.isfile(path):
+        return _decompress(open(path, 'rb'), path)
+
+    archive, member = split_archive_path(path)
+    if archive is None:
+        raise FileNotFoundError(path)
+    # ZipFile liczy odwołania do pliku archiwum – strumień elementu pozostaje
+    # ważny po zamknięciu ZipFile, a plik archiwum zamyka się razem ze strumieniem
+    with zipfile.ZipFile(archive) as zf:
+        try:
+            stream = zf.open(member)
+        except KeyError:
+            raise FileNotFoundError(path)
+    return _decompress(stream, member)
+
+
+def open_input_text(path: str, encoding: str, errors: str = 'replace'):
+    """Otwiera plik wejściowy jako strumień tekstowy (dowolne źródło obsługiwane przez open_input)."""
+    return io.TextIOWrapper(open_input(path), encoding=encoding, errors=errors)
+
+
+def base_name(path: str) -> str:
+    """Nazwa pliku bez rozszerzenia kompresji i typu: 'x/1_11937.csv.gz' -> '1_11937'."""
+    name = os.path.basename(os.path.normpath(path))
+    lower = name.lower()
+    for suffix in COMPRESSION_SUFFIXES:
+        if lower.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return os.path.splitext(name)[0]
+
+
+def list_members(archive: str, suffixes=('.csv', '.csv.gz', '.csv.zst')) -> list:
+    """Zwraca ścieżki (archiwum/element) wszystkich pasujących plików w archiwum zip."""
+    with zipfile.ZipFile(archive) as zf:
+        names = [n for n in zf.namelist() if not n.endswith('/') and n.lower().endswith(suffixes)]
+    return [os.path.join(archive, *name.split('/')) for name in sorted(names)]
@@ -0,0 +1,117 @@
+"""
+Columnar binary tables (.npz) shared by the generator and the analyser.
+
+String columns are dictionary-encoded: a table stores '<name>__codes' (int16,
+or int32 for more than 32767 categories) and '<name>__categories' (unicode array)
+instead of one string per row. Numeric columns are stored as plain arrays
+(Value as float64). Arrays are zlib-compressed inside the .npz container.
+"""
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+COLUMNS_KEY = '__columns__'
+CODES_SUFFIX = '__codes'
+CATEGORIES_SUFFIX = '__categories'
+
+# Dictionary-encoded column: categories[codes] gives the original strings.
+Categorical = namedtuple('Categorical', ['codes', 'categories'])
+
+# Per-group numeric column: values[codes] gives the value of every row
+# (e.g. group statistics spread onto the rows of their group).
+Grouped = namedtuple('Grouped', ['codes', 'values'])
+
+
+def factorize(values):
+    """
+    Encode a sequence of hashable values as (codes, categories) in order of first appearance.
+    Returns an int32 code array and a list of unique values.
+    """
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) for v in values),
+        dtype=np.int32,
+    )
+    return codes, list(index)
+
+
+def to_strings(column):
+    """Return a column as an array of Python objects, decoding Categorical columns."""
+    if isinstance(column, Categorical):
+        categories = np.asarray(column.categories, dtype=object)
+        return categories[column.codes]
+    return np.asarray(column)
+
+
+class TableBuilder:
+    """
+    Accumulate rows into compact typed buffers, dictionary-encoding string columns on the fly.
+    dtypes maps column names (in row order) to str for categorical columns
+    or to a NumPy dtype for numeric ones.
+    """
+
+    def __init__(self, dtypes):
+        self.dtypes = dict(dtypes)
+        self._indexes = {name: {} for name, dtype in self.dtypes.items() if dtype is str}
+        self._buffers = [
+            array('i') if dtype is str else array('d')
+            for dtype in self.dtypes.values()
+        ]
+        self._encoders = [self._indexes.get(name) for name in self.dtypes]
+
+    def __len__(self):
+        return len(self._buffers[0]) if self._buffers else 0
+
+    def append(self, row):
+        """Append one row given as a sequence ordered like dtypes."""
+        for value, buf, index in zip(row, self._buffers, self._encoders):
+            if index is not None:
+                value = index.setdefault(value, len(index))
+            buf.append(value)
+
+    def columns(self):
+        """Return the accumulated data as an ordered dict {name: ndarray or Categorical}."""
+        result = {}
+        for (name, dtype), buf in zip(self.dtypes.items(), self._buffers):
+            if dtype is str:
+                codes = np.frombuffer(buf, dtype=np.intc).astype(np.int32)
+                result[name] = Categorical(codes, list(self._indexes[name]))
+            else:
+                result[name] = np.frombuffer(buf, dtype=np.float64).astype(dtype)
+        return result
+
+
+def write_table(path, columns):
+    """
+    Write an ordered mapping {name: column} to an .npz file.
+    A column is either a Categorical or anything np.asarray accepts (numeric).
+    """
+    arrays = {COLUMNS_KEY: np.array(list(columns), dtype=str)}
+    for name, column in columns.items():
+        if isinstance(column, Categorical):
+            code_dtype = np.int16 if len(column.categories) <= np.iinfo(np.int16).max else np.int32
+            arrays[name + CODES_SUFFIX] = np.asarray(column.codes, dtype=code_dtype)
+            arrays[name + CATEGORIES_SUFFIX] = np.array(list(column.categories), dtype=str)
+        else:
+            arrays[name] = np.asarray(column)
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+
+
+def read_table(path):
+    """
+    Read a table written by write_table.
+    Returns an ordered dict {name: ndarray or Categorical}.
+    """
+    table = {}
+    with np.load(path, allow_pickle=False) as data:
+        for name in data[COLUMNS_KEY].tolist():
+            if name + CODES_SUFFIX in data.files:
+                table[name] = Categorical(
+                    data[name + CODES_SUFFIX].astype(np.int32),
+                    data[name + CATEGORIES_SUFFIX].tolist(),
+                )
+            else:
+                table[name] = data[name]
+    return table
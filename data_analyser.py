@@ -1,331 +1,792 @@
 import os
+import sys
 import csv
-import statistics
+import json
+import zlib
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import analysis_config
+import bootstrap
+import columnar
+import dose_response
+import group_stats
+import measurement_table
+import normalization
+import partials
+import plate_qc
+import significance
+import spatial
+import time_course
+from measurement_table import MeasurementTable
 from logger_setup import logger
 
 DATA_DIR = 'data'
 MERGED_FILENAME = 'data_merged.csv'
 RATIOS_FILENAME = 'ratios.csv'
+SUMMARY_FILENAME = 'summary.csv'
+SUMMARY_COLUMNS = ['Subdir', 'Sample', 'Measurement', 'Denominator', 'N', 'Mean', 'Std', 'SEM']
+# Written after SUMMARY_COLUMNS when bootstrap intervals are enabled
+CI_COLUMNS = ['CI_Low', 'CI_High']
+RAW_SUFFIXES = ('_data.csv', '_data.npz')
 REQUIRED_COLUMNS = {'Sample', 'Plate', 'Row', 'Column', 'Well', 'Measurement', 'Value'}
+WELL_INDEX_COLUMNS = ('Plate', 'Well')  # studzienka jednoznacznie wyznaczona przez płytkę i pozycję
+# Klucze konfiguracji zmieniające wartości płytki przed statystykami (normalizacja, korekta przestrzenna)
+PLATE_PREPARATION_KEYS = ('normalization', 'spatial_correction')
+ANALYSER_WORKERS = 1  # liczba procesów analizujących podkatalogi równolegle (0 = liczba rdzeni CPU)
+
+# Wynik analizy jednego podkatalogu: nazwa, typy pomiarów, zapisane pliki, opis błędu ('' gdy brak)
+# i kolumny podsumowania w pełnej precyzji (summary_table; None przy błędzie) – dla przebiegu czasowego
+SubdirResult = namedtuple('SubdirResult', ['subdir', 'measurements', 'outputs', 'error', 'summary'],
+                          defaults=(None,))
 
 
 def read_data(path):
-    """Read a CSV file and return a list of row dicts."""
+    """Read a CSV (or columnar .npz) file into a MeasurementTable; None when it cannot be read."""
     try:
-        with open(path, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = [dict(row) for row in reader]
-        return rows
+        return measurement_table.read_table(path)
     except Exception as e:
         logger.error("Nie udało się wczytać %s: %s", path, e)
-        return []
+        return None
 
 
-def write_data(path, rows, fieldnames):
-    """Write a list of dict rows to a CSV file with specified fieldnames."""
+def _csv_strings(name, column):
+    """
+    Format one output column for CSV: categorical columns are decoded, raw 'Value'
+    keeps the float repr, other floats get 4 decimals and integers their plain form.
+    Grouped columns (per-group statistics) are formatted once per group and then
+    spread onto the rows.
+    """
+    if isinstance(column, columnar.Grouped):
+        formatted = np.array(_csv_strings(name, column.values), dtype=object)
+        return formatted[column.codes]
+    if isinstance(column, columnar.Categorical):
+        return columnar.to_strings(column)
+    if isinstance(column, np.ndarray) and column.dtype.kind == 'f':
+        if name in (measurement_table.VALUE_COLUMN, measurement_table.RAW_VALUE_COLUMN):
+            return [repr(v) for v in column.tolist()]
+        return [f"{v:.4f}" for v in column.tolist()]
+    if isinstance(column, np.ndarray) and column.dtype.kind in 'iu':
+        return [str(v) for v in column.tolist()]
+    return column
+
+
+def write_data(path, columns):
+    """
+    Write an ordered mapping {column name: column} to a CSV file. A column is a sequence
+    of strings, a columnar.Categorical or Grouped, or a numeric array (formatted by _csv_strings).
+    Returns True on success.
+    """
     try:
         with open(path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
+            writer = csv.writer(f)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*(_csv_strings(n, c) for n, c in columns.items())))
         logger.info("Zapisano dane do %s", path)
+        return True
     except Exception as e:
         logger.error("Nie udało się zapisać %s: %s", path, e)
+        return False
+
+
+def write_columnar(path, columns):
+    """Write output columns to a columnar .npz table (string columns dictionary-encoded)."""
+    table = {}
+    for name, column in columns.items():
+        if isinstance(column, columnar.Grouped):
+            table[name] = column.values[column.codes]
+        elif isinstance(column, columnar.Categorical) or (
+                isinstance(column, np.ndarray) and column.dtype.kind in 'fiu'):
+            table[name] = column
+        else:
+            table[name] = columnar.Categorical(*columnar.factorize(column))
+    try:
+        columnar.write_table(path, table)
+        logger.info("Zapisano dane do %s", path)
+        return True
+    except Exception as e:
+        logger.error("Nie udało się zapisać %s: %s", path, e)
+        return False
+
+
+def write_outputs(csv_path, columns, formats=('csv',)):
+    """
+    Write output columns in the requested formats: 'csv' to csv_path and 'npz'
+    next to it (same name, .npz extension). Returns the list of written files.
+    """
+    written = []
+    if 'csv' in formats and write_data(csv_path, columns):
+        written.append(csv_path)
+    if 'npz' in formats:
+        npz_path = os.path.splitext(csv_path)[0] + '.npz'
+        if write_columnar(npz_path, columns):
+            written.append(npz_path)
+    return written
 
 
 def find_raw_files(dir_path):
     """
-    Find all input CSV files in a given directory ending with '_data.csv'.
+    Find all input files in a given directory ending with '_data.csv' or '_data.npz'.
+    When a plate has both, the columnar '_data.npz' is used.
     Skip any existing merged or ratios outputs.
     """
-    raw_files = []
+    raw_files = {}
     for fname in os.listdir(dir_path):
-        if not fname.lower().endswith('_data.csv'):
+        lower = fname.lower()
+        if not lower.endswith(RAW_SUFFIXES):
             continue
-        if fname in {MERGED_FILENAME, RATIOS_FILENAME} or fname.endswith('_analysed.csv'):
+        if fname in {MERGED_FILENAME, RATIOS_FILENAME, SUMMARY_FILENAME, significance.SIGNIFICANCE_FILENAME,
+                     dose_response.DOSE_RESPONSE_FILENAME, plate_qc.QC_FILENAME} or fname.endswith('_analysed.csv'):
             continue
         full_path = os.path.join(dir_path, fname)
-        if os.path.isfile(full_path):
-            raw_files.append(full_path)
-    return sorted(raw_files)
+        if not os.path.isfile(full_path):
+            continue
+        stem = fname[:-len('_data.csv')]
+        if stem not in raw_files or lower.endswith('.npz'):
+            raw_files[stem] = full_path
+    return sorted(raw_files.values())
+
+
+def preparation_tag(config=None):
+    """
+    Stable integer identifying the plate preparation settings of a config
+    (PLATE_PREPARATION_KEYS; 0 when none is set); tags cached plate partials.
+    """
+    if config is None:
+        return 0
+    settings = {key: config[key] for key in PLATE_PREPARATION_KEYS if config.get(key)}
+    if not settings:
+        return 0
+    return zlib.crc32(json.dumps(settings, sort_keys=True).encode('utf-8'))
 
 
-def merge_data(file_paths):
+def load_plate(path, config=None):
+    """
+    Read one raw plate file into a MeasurementTable.
+    config – optional analysis config; its normalization rules (normalization.py) and then
+    spatial correction (spatial.py) are applied to the plate.
+    Returns None (after a warning) when the file is empty, unreadable or lacks required columns.
+    """
+    table = read_data(path)
+    if table is None or not len(table):
+        logger.warning("Pominięto pusty lub nieczytelny plik: %s", path)
+        return None
+
+    header_cols = set(table.fieldnames)
+    if not REQUIRED_COLUMNS.issubset(header_cols):
+        missing = REQUIRED_COLUMNS - header_cols
+        logger.warning(
+            "Plik %s nie zawiera kolumn: %s; pomijam.",
+            path, missing
+        )
+        return None
+    if config is None:
+        return table
+    table = normalization.normalize_table(table, config['normalization'], path)
+    return spatial.correct_table(table, config['spatial_correction'], path)
+
+
+def merge_data(file_paths, loaded=None, config=None):
     """
-    Merge rows from all valid CSVs into a single list of rows.
+    Merge all valid input files into a single MeasurementTable.
     Ensure each file has the required columns; skip otherwise.
-    Returns (merged_rows, all_fieldnames) where merged_rows have '_float_value' for internal use.
+    loaded – optional cache {path: table or None} of files already read by load_plate;
+    config – analysis config passed to load_plate.
+    Returns None when no file contains valid data.
     """
-    merged_rows = []
-    all_fieldnames = set()
+    if loaded is None:
+        loaded = {}
+    tables = []
 
     for path in file_paths:
-        rows = read_data(path)
-        if not rows:
-            logger.warning("Pominięto pusty lub nieczytelny plik: %s", path)
-            continue
-
-        header_cols = set(rows[0].keys())
-        if not REQUIRED_COLUMNS.issubset(header_cols):
-            missing = REQUIRED_COLUMNS - header_cols
-            logger.warning(
-                "Plik %s nie zawiera kolumn: %s; pomijam.",
-                path, missing
-            )
-            continue
+        if path not in loaded:
+            loaded[path] = load_plate(path, config)
+        if loaded[path] is not None:
+            tables.append(loaded[path])
 
-        all_fieldnames.update(rows[0].keys())
+    if not tables:
+        logger.error("Brak poprawnych danych do scalenia.")
+        return None
 
-        for r in rows:
-            try:
-                r['_float_value'] = float(r['Value'])
-                merged_rows.append(r)
-            except ValueError:
-                logger.warning(
-                    "Nieprawidłowa wartość w kolumnie 'Value' w %s (Sample=%s, Measurement=%s); pomijam wiersz.",
-                    path, r.get('Sample', ''), r.get('Measurement', '')
-                )
+    return tables[0] if len(tables) == 1 else MeasurementTable.concat(tables)
 
-    if not merged_rows:
-        logger.error("Brak poprawnych danych do scalenia.")
-        return [], []
 
-    return merged_rows, list(all_fieldnames)
+def plate_statistics(file_paths, loaded=None, config=None):
+    """
+    Timepoint statistics per (Sample, Measurement) merged from per-plate partials
+    (see partials.py). Only plates whose partials are missing or out of date are read;
+    loaded – optional cache {path: table or None} shared with merge_data;
+    config – analysis config passed to load_plate (partials are kept separately for every
+    set of plate preparation settings, see preparation_tag).
+    Returns (keys, GroupStats) where keys[i] is the (Sample, Measurement) of group i.
+    """
+    if loaded is None:
+        loaded = {}
+    variant = preparation_tag(config)
+    plate_parts = []
+    for path in file_paths:
+        plate = partials.load_partials(path, variant)
+        if plate is None:
+            if path not in loaded:
+                loaded[path] = load_plate(path, config)
+            if loaded[path] is None:
+                continue
+            plate = partials.plate_partials(path, loaded[path], variant)
+        plate_parts.append(plate)
+    return partials.merge_partials(plate_parts)
+
+
+def broadcast_stats(table, merged, stats=('Mean', 'Std'), prefix=''):
+    """
+    Spread statistics merged per (Sample, Measurement) (the result of plate_statistics)
+    onto the rows of table. Returns {column name: Grouped(row -> group, per-group values)}.
+    """
+    keys, result = merged
+    index = {key: i for i, key in enumerate(keys)}
+    row_codes, row_keys = table.group_codes(*partials.GROUP_COLUMNS)
+    rows = np.array([index[key] for key in row_keys], dtype=np.int32)[row_codes]
+    return {
+        prefix + name: columnar.Grouped(rows, getattr(result, analysis_config.STAT_FIELDS[name]))
+        for name in stats
+    }
 
 
-def strip_auxiliary(rows):
+def add_group_stats(codes, values, n_groups, stats=('Mean', 'Std'), prefix=''):
     """
-    Remove internal-use keys like '_float_value' from each row dict.
+    Compute per-group statistics in one vectorized pass (see group_stats).
+    stats – names from analysis_config.STAT_FIELDS; prefix is prepended to the column names.
+    Returns ({column name: Grouped(codes, per-group values)}, GroupStats), so every
+    row refers to the statistics of its group and each value is formatted only once.
     """
-    for r in rows:
-        r.pop('_float_value', None)
+    result = group_stats.grouped_stats(codes, values, n_groups)
+    codes = np.asarray(codes, dtype=np.int32)
+    columns = {
+        prefix + name: columnar.Grouped(codes, getattr(result, analysis_config.STAT_FIELDS[name]))
+        for name in stats
+    }
+    return columns, result
 
 
-def compute_single_measurement_stats(rows):
+def compute_single_measurement_stats(table, stats=('Mean', 'Std'), merged=None):
     """
     Dla przypadków z jednym typem pomiaru:
-    oblicz średnią i odchylenie standardowe dla każdej próbki (Sample)
-    i dodaj kolumny 'Mean' oraz 'Std'.
+    oblicz średnią i odchylenie standardowe (lub inne statystyki z listy stats) dla każdej próbki (Sample).
+    merged – statystyki scalone z częściowych agregatów płytek (plate_statistics); gdy podane,
+    nie są liczone ponownie.
+    Zwraca kolumny 'Mean' oraz 'Std' (wartość dla każdego wiersza tabeli).
+    """
+    if merged is not None:
+        return broadcast_stats(table, merged, stats)
+    columns, _ = add_group_stats(table.codes('Sample'), table.value, len(table.categories('Sample')), stats)
+    return columns
+
+
+def compute_multi_measurement_stats(table, stats=('Mean', 'Std'), merged=None):
+    """
+    Dla przypadków z wieloma typami pomiaru (bez ratio):
+    oblicz średnią i odchylenie standardowe (lub inne statystyki z listy stats)
+    dla każdej pary (Sample, Measurement).
+    merged – jak w compute_single_measurement_stats.
+    Zwraca kolumny 'Mean' oraz 'Std' (wartość dla każdego wiersza tabeli).
+    """
+    if merged is not None:
+        return broadcast_stats(table, merged, stats)
+    codes, keys = table.group_codes('Sample', 'Measurement')
+    columns, _ = add_group_stats(codes, table.value, len(keys), stats)
+    return columns
+
+
+def merged_columns(table, stats_columns):
+    """
+    Return the columns of data_merged.csv: every column of the merged table
+    (in file order) followed by the statistics columns, e.g. Mean and Std.
     """
-    by_sample = {}
-    for r in rows:
-        sample = r['Sample']
-        value = r['_float_value']
-        by_sample.setdefault(sample, []).append(value)
+    columns = {
+        name: table.value if name == measurement_table.VALUE_COLUMN else table.columns[name]
+        for name in table.fieldnames
+    }
+    columns.update(stats_columns)
+    return columns
 
-    stats = {}
-    for sample, vals in by_sample.items():
-        mean = statistics.mean(vals)
-        std = statistics.stdev(vals) if len(vals) > 1 else 0.0
-        stats[sample] = (mean, std)
 
-    for r in rows:
-        mean, std = stats[r['Sample']]
-        r['Mean'] = f"{mean:.4f}"
-        r['Std'] = f"{std:.4f}"
+def ratio_pairs(ratios, measurements):
+    """
+    Rozwija ustawienie ratio do listy par (licznik, mianownik):
+    'all' – pełna macierz N×N (wszystkie uporządkowane pary różnych pomiarów),
+    (licznik, mianownik) – jedna para, lista par – wszystkie podane pary.
+    """
+    if ratios == analysis_config.ALL_RATIOS:
+        return [(num, den) for num in measurements for den in measurements if num != den]
+    if len(ratios) == 2 and all(isinstance(name, str) for name in ratios):
+        return [tuple(ratios)]
+    return [tuple(pair) for pair in ratios]
 
 
-def compute_multi_measurement_stats(rows):
+def summary_columns(subdir, samples, measurements, denominators, result, ci=None):
     """
-    Dla przypadków z dwoma typami pomiaru (bez ratio):
-    oblicz średnią i odchylenie standardowe dla każdej pary (Sample, Measurement)
-    i dodaj kolumny 'Mean' oraz 'Std'.
+    Columns of the summary table for one block of groups: one row per (sample, measurement)
+    or, when denominators are non-empty, per (sample, ratio). result – GroupStats of the groups;
+    ci – optional (low, high) bootstrap intervals of the means.
     """
-    by_sample_meas = {}
-    for r in rows:
-        key = (r['Sample'], r['Measurement'])
-        value = r['_float_value']
-        by_sample_meas.setdefault(key, []).append(value)
+    count = len(samples)
+    columns = {
+        'Subdir': [subdir] * count,
+        'Sample': list(samples),
+        'Measurement': list(measurements),
+        'Denominator': list(denominators),
+        'N': np.asarray(result.count, dtype=np.int64),
+        'Mean': result.mean,
+        'Std': result.std,
+        'SEM': result.sem,
+    }
+    if ci is not None:
+        columns.update(zip(CI_COLUMNS, ci))
+    return columns
+
+
+def summary_table(parts):
+    """Concatenate the blocks built by summary_columns (measurements first, then ratios)."""
+    columns = {}
+    names = SUMMARY_COLUMNS + [name for name in CI_COLUMNS if name in parts[0]]
+    for name in names:
+        values = [part[name] for part in parts]
+        if isinstance(values[0], np.ndarray):
+            columns[name] = np.concatenate(values)
+        else:
+            columns[name] = [v for block in values for v in block]
+    return columns
 
-    stats = {}
-    for key, vals in by_sample_meas.items():
-        mean = statistics.mean(vals)
-        std = statistics.stdev(vals) if len(vals) > 1 else 0.0
-        stats[key] = (mean, std)
 
-    for r in rows:
-        mean, std = stats[(r['Sample'], r['Measurement'])]
-        r['Mean'] = f"{mean:.4f}"
-        r['Std'] = f"{std:.4f}"
+def write_summary(subdir_path, parts, formats=('csv',)):
+    """
+    Write summary.csv of a subdirectory from the blocks built by summary_columns.
+    Returns the list of written files.
+    """
+    return write_outputs(os.path.join(subdir_path, SUMMARY_FILENAME), summary_table(parts), formats)
 
 
-def compute_and_write_ratios(subdir_path, rows, measurements, num, den):
+def write_significance(subdir_path, parts, comparisons, p_adjust='holm', formats=('csv',)):
+    """
+    Welch t-tests between the requested sample pairs (and Welch ANOVA) for every measurement
+    and ratio of the summary, written to significance.csv (see significance.py).
+    Returns the list of written files.
     """
-    Oblicz ratio dla wybranych pomiarów (num, den) dla wszystkich wierszy,
-    a następnie policz Ratio_Mean i Ratio_Std na poziomie Sample i zapisz wynik do pliku 'ratios.csv' w danym podkatalogu.
+    columns = significance.test_columns(summary_table(parts), comparisons, p_adjust)
+    if not columns['Test']:
+        logger.info("Brak porównań do przetestowania w %s.", subdir_path)
+        return []
+    return write_outputs(os.path.join(subdir_path, significance.SIGNIFICANCE_FILENAME), columns, formats)
+
+
+def compute_and_write_ratios(subdir_path, table, measurements, pairs, stats=('Mean', 'Std'), formats=('csv',),
+                             summary=None, ci=None):
+    """
+    Oblicz ratio dla wybranych par pomiarów (licznik, mianownik) dla wszystkich studzienek,
+    a następnie policz Ratio_Mean i Ratio_Std na poziomie (Sample, para) i zapisz wynik do pliku 'ratios.csv' w danym podkatalogu.
+    Wartości są wyrównywane w macierz studzienka × pomiar przez całkowite indeksy (płytka, studzienka),
+    więc wszystkie pary liczone są jednym wektorowym dzieleniem (bez łączenia słownikami).
+    Brakujące i zerowe mianowniki są raportowane jako liczby studzienek dla każdej pary.
+    stats i formats – jak w konfiguracji analizy (kolumny Ratio_<statystyka>, formaty plików).
+    Jeśli podano listę summary, zostanie uzupełniona o kolumny podsumowania ratio (summary_columns).
+    ci – opcjonalna funkcja (kody grup, wartości, liczba grup) -> (dolna, górna granica),
+    np. bootstrap.bootstrap_ci; przedziały Ratio_Mean trafiają do podsumowania.
+    Zwraca listę zapisanych plików (pustą, gdy stosunków nie policzono).
     """
     # Sprawdź, czy podano poprawne nazwy pomiarów
-    if num not in measurements or den not in measurements:
-        logger.error("Niepoprawne nazwy pomiarów: %s, %s", num, den)
-        return
-
-    # Zbuduj mapę wartości mianownika na podstawie klucza (Sample, Plate, Row, Column, Well)
-    denom_map = {}
-    for r in rows:
-        if r['Measurement'] == den:
-            key = (r['Sample'], r['Plate'], r['Row'], r['Column'], r['Well'])
-            denom_map[key] = r['_float_value']
-
-    ratio_rows = []
-    ratio_by_sample = {}
-
-    for r in rows:
-        if r['Measurement'] != num:
-            continue
-        key = (r['Sample'], r['Plate'], r['Row'], r['Column'], r['Well'])
-        denom_value = denom_map.get(key)
-        if denom_value is None:
-            logger.warning(
-                "Brak dopasowania mianownika dla Sample=%s, Plate=%s, Well=%s; pomijam ratio.",
-                r['Sample'], r['Plate'], r['Well']
-            )
-            continue
-        if denom_value == 0:
-            logger.warning(
-                "Mianownik równy zero dla Sample=%s, Plate=%s, Well=%s; pomijam ratio.",
-                r['Sample'], r['Plate'], r['Well']
-            )
-            continue
+    valid_pairs = []
+    for num, den in pairs:
+        if num not in measurements or den not in measurements:
+            logger.error("Niepoprawne nazwy pomiarów: %s, %s", num, den)
+        else:
+            valid_pairs.append((num, den))
+    if not valid_pairs:
+        return []
 
-        nom_value = r['_float_value']
-        ratio = nom_value / denom_value
-
-        ratio_row = {
-            'Sample': r['Sample'],
-            'Nominator_Plate': r['Plate'],
-            'Nominator_Well': r['Well'],
-            'Nominator_Measurement': num,
-            'Nominator_Value': f"{nom_value:.4f}",
-            'Denominator_Sample': r['Sample'],
-            'Denominator_Plate': r['Plate'],
-            'Denominator_Well': r['Well'],
-            'Denominator_Measurement': den,
-            'Denominator_Value': f"{denom_value:.4f}",
-            'Ratio': f"{ratio:.4f}"
-        }
-        ratio_rows.append(ratio_row)
-        ratio_by_sample.setdefault(r['Sample'], []).append(ratio)
-
-    if not ratio_rows:
+    # Macierz studzienka (Plate, Well) × pomiar
+    well_rows, values, present = table.pivot(WELL_INDEX_COLUMNS, 'Measurement')
+    wells = table.take(well_rows)
+    categories = table.categories('Measurement')
+    num_codes = np.array([categories.index(num) for num, _ in valid_pairs], dtype=np.intp)
+    den_codes = np.array([categories.index(den) for _, den in valid_pairs], dtype=np.intp)
+
+    # Kolumny macierzy: kolejne pary; wiersze: studzienki z licznikiem
+    nom_values = values[:, num_codes]
+    den_values = values[:, den_codes]
+    has_nom = present[:, num_codes]
+    missing_den = has_nom & ~present[:, den_codes]
+    zero_den = has_nom & ~missing_den & (den_values == 0)
+    valid = has_nom & ~missing_den & ~zero_den
+
+    for (num, den), n_missing, n_zero in zip(valid_pairs, missing_den.sum(axis=0).tolist(),
+                                             zero_den.sum(axis=0).tolist()):
+        if n_missing:
+            logger.warning("Brak dopasowania mianownika (%s) dla %d studzienek z %s w %s; pomijam te ratio.",
+                           den, n_missing, num, subdir_path)
+        if n_zero:
+            logger.warning("Mianownik (%s) równy zero dla %d studzienek w %s; pomijam te ratio.",
+                           den, n_zero, subdir_path)
+
+    if not valid.any():
         logger.error("Brak poprawnych par (licznik/mianownik) do obliczenia stosunków.")
-        return
+        return []
+
+    # Spłaszcz w kolejności: para, potem studzienka
+    pair_index, well_index = np.nonzero(valid.T)
+    nominators = wells.take(well_index)
+    nom_flat = nom_values[well_index, pair_index]
+    den_flat = den_values[well_index, pair_index]
+    ratio_values = nom_flat / den_flat
+    num_names = columnar.Categorical(pair_index.astype(np.int32), [num for num, _ in valid_pairs])
+    den_names = columnar.Categorical(pair_index.astype(np.int32), [den for _, den in valid_pairs])
 
     # Oblicz Ratio_Mean i Ratio_Std dla każdego Sample
-    ratio_stats = {}
-    for sample, vals in ratio_by_sample.items():
-        mean = statistics.mean(vals)
-        std = statistics.stdev(vals) if len(vals) > 1 else 0.0
-        ratio_stats[sample] = (mean, std)
-
-    for r in ratio_rows:
-        mean, std = ratio_stats[r['Sample']]
-        r['Ratio_Mean'] = f"{mean:.4f}"
-        r['Ratio_Std'] = f"{std:.4f}"
-
-    # Przygotuj nazwy kolumn w pliku ratios.csv
-    fieldnames = [
-        'Sample',
-        'Nominator_Plate', 'Nominator_Well', 'Nominator_Measurement', 'Nominator_Value',
-        'Denominator_Sample', 'Denominator_Plate', 'Denominator_Well', 'Denominator_Measurement', 'Denominator_Value',
-        'Ratio', 'Ratio_Mean', 'Ratio_Std'
-    ]
+    n_samples = len(nominators.categories('Sample'))
+    group_codes = pair_index * n_samples + nominators.codes('Sample')
+    stats_columns, ratio_stats = add_group_stats(
+        group_codes, ratio_values, len(valid_pairs) * n_samples, stats, prefix='Ratio_'
+    )
+    if summary is not None:
+        groups = np.flatnonzero(ratio_stats.count)
+        intervals = None
+        if ci is not None:
+            intervals = [bound[groups] for bound in ci(group_codes, ratio_values, len(valid_pairs) * n_samples)]
+        sample_names = nominators.categories('Sample')
+        keys = [(sample_names[g % n_samples], valid_pairs[g // n_samples]) for g in groups.tolist()]
+        summary.append(summary_columns(
+            os.path.basename(os.path.normpath(subdir_path)),
+            [sample for sample, _ in keys], [num for _, (num, _) in keys], [den for _, (_, den) in keys],
+            group_stats.GroupStats(*(field[groups] for field in ratio_stats)), intervals,
+        ))
+
+    # Kolumny pliku ratios.csv (studzienka licznika i mianownika jest ta sama)
+    columns = {
+        'Sample': nominators.columns['Sample'],
+        'Nominator_Plate': nominators.columns['Plate'],
+        'Nominator_Well': nominators.columns['Well'],
+        'Nominator_Measurement': num_names,
+        'Nominator_Value': nom_flat,
+        'Denominator_Sample': nominators.columns['Sample'],
+        'Denominator_Plate': nominators.columns['Plate'],
+        'Denominator_Well': nominators.columns['Well'],
+        'Denominator_Measurement': den_names,
+        'Denominator_Value': den_flat,
+        'Ratio': ratio_values,
+    }
+    columns.update(stats_columns)
 
     out_path = os.path.join(subdir_path, RATIOS_FILENAME)
     if os.path.exists(out_path):
         logger.info("Plik %s już istnieje i zostanie nadpisany w %s.", RATIOS_FILENAME, subdir_path)
-    write_data(out_path, ratio_rows, fieldnames)
+    return write_outputs(out_path, columns, formats)
 
 
-def analyze_all():
+def ask_ratio_measurements(measurement_types):
     """
-    Główna funkcja:
-    Dla każdego podkatalogu w katalogu DATA_DIR:
-      1. Znajduje wszystkie pliki kończące się na '_data.csv'.
-      2. Scala je w jeden data_merged.csv w danym podkatalogu.
-      3. Jeśli jest jeden typ pomiaru: oblicza Mean/Std per Sample.
-         Jeśli są dwa typy pomiaru: oblicza Mean/Std per (Sample, Measurement), zapisuje merged,
-         a następnie (raz tylko) pyta, czy wygenerować ratios.csv i jakie pomiary użyć (należy wybrać spośród wszystkich podkatalogów).
+    Pyta użytkownika, czy liczyć stosunki i które pomiary użyć.
+    Zwraca False (bez ratios.csv), krotkę (licznik, mianownik) albo 'all' (pełna macierz N×N).
+    """
+    choice = input(
+        "Znaleziono co najmniej dwa typy pomiarów w przynajmniej jednym podkatalogu. "
+        "Czy chcesz obliczyć stosunki dla wszystkich podkatalogów? (t/n/w – wszystkie pary): "
+    ).strip().lower()
+    if choice == 'w':
+        return analysis_config.ALL_RATIOS
+    if choice != 't':
+        return False
+    num = input(f"Podaj nazwę pomiaru, który ma być licznikiem spośród {measurement_types}: ").strip()
+    den = input(f"Podaj nazwę pomiaru, który ma być mianownikiem spośród {measurement_types}: ").strip()
+    return num, den
+
+
+def scan_measurement_types(subdir_path):
     """
-    # Zmienna do przechowania, czy już zapytano użytkownika o liczenie ratio
-    ratio_choice_asked = False
-    ratio_enabled = False
-    num = den = None  # Nazwy pomiarów dla licznika i mianownika, gdy ratio_enabled=True
+    Zwraca posortowaną listę typów pomiarów w podkatalogu, czytając tylko kolumnę Measurement
+    plików źródłowych (bez scalania) – używane do zebrania konfiguracji ratio przed analizą równoległą.
+    """
+    types = set()
+    for path in find_raw_files(subdir_path):
+        try:
+            types.update(measurement_table.read_unique(path, 'Measurement'))
+        except Exception as e:
+            logger.warning("Nie udało się odczytać typów pomiarów z %s: %s", path, e)
+    return sorted(types)
 
-    # Iteruj po każdym podkatalogu w DATA_DIR
-    for subdir_name in os.listdir(DATA_DIR):
-        subdir_path = os.path.join(DATA_DIR, subdir_name)
-        if not os.path.isdir(subdir_path):
-            continue
 
-        raw_files = find_raw_files(subdir_path)
-        if not raw_files:
-            logger.warning("Brak plików źródłowych w podkatalogu '%s'; pomijam.", subdir_path)
-            continue
+def write_dose_response(subdir_path, parts, pattern=True, formats=('csv',)):
+    """
+    Fit 4PL curves to the concentration series of the summary (see dose_response.py)
+    and write dose_response.csv. pattern – True for dose_response.DEFAULT_PATTERN or a regex.
+    Returns the list of written files.
+    """
+    if pattern is True:
+        pattern = dose_response.DEFAULT_PATTERN
+    columns = dose_response.fit_columns(summary_table(parts), pattern)
+    if columns is None:
+        logger.info("Brak serii stężeń (co najmniej %d dawki) w %s.", dose_response.MIN_DOSES, subdir_path)
+        return []
+    return write_outputs(os.path.join(subdir_path, dose_response.DOSE_RESPONSE_FILENAME), columns, formats)
+
+
+def write_summary_outputs(subdir_path, summary, config):
+    """Write summary.csv and the tables derived from it (significance, dose response) enabled in config."""
+    formats = config['output_formats']
+    outputs = write_summary(subdir_path, summary, formats)
+    if config['comparisons']:
+        outputs.extend(write_significance(subdir_path, summary, config['comparisons'], config['p_adjust'], formats))
+    if config['dose_response']:
+        outputs.extend(write_dose_response(subdir_path, summary, config['dose_response'], formats))
+    return outputs
+
 
+def analyze_subdir(subdir_path, ratios=False, config=None):
+    """
+    Analizuje jeden podkatalog: scala pliki źródłowe do data_merged.csv, oblicza Mean/Std
+    i (przy co najmniej dwóch typach pomiaru) opcjonalnie zapisuje ratios.csv.
+    Zapisuje też summary.csv – jeden wiersz na (Sample, Measurement) i na (Sample, ratio)
+    z kolumnami N, Mean, Std i SEM (Denominator wypełniony tylko dla ratio).
+    ratios – False (bez ratios.csv), (licznik, mianownik), lista par, 'all' (pełna macierz N×N)
+    albo funkcja przyjmująca listę typów pomiarów i zwracająca jedną z tych wartości
+    (wywoływana tylko przy co najmniej dwóch typach).
+    config – konfiguracja analizy (słownik z analysis_config); używane są klucze
+    'stats', 'output_formats', 'write_merged' oraz 'bootstrap_resamples', 'confidence_level'
+    i 'bootstrap_seed' (przedziały ufności CI_Low/CI_High w summary.csv) oraz 'normalization'
+    (odjęcie tła / normalizacja do studzienek kontrolnych każdej płytki przed statystykami
+    i ratio) oraz 'spatial_correction' (median polish / B-score każdej płytki); oryginalne wartości
+    trafiają do kolumny Raw_Value. Klucze 'comparisons' i 'p_adjust' włączają testy Welcha
+    między próbkami (significance.csv), a 'dose_response' – dopasowanie krzywych 4PL do serii
+    stężeń (dose_response.csv). Przy 'qc' z "exclude": true pomijane są płytki oznaczone
+    w plate_qc.csv jako niespełniające kryteriów. Domyślnie DEFAULT_CONFIG.
+    Mean/Std pochodzą z częściowych agregatów płytek (partials.py), więc przy write_merged=false
+    i bez ratio czytane są tylko płytki dodane lub zmienione od poprzedniej analizy.
+    Zwraca SubdirResult; błąd opisuje pole error, a pole summary zawiera kolumny summary.csv
+    w pełnej precyzji (bez zaokrągleń zapisu).
+    """
+    if config is None:
+        config = analysis_config.DEFAULT_CONFIG
+    stats = config['stats']
+    formats = config['output_formats']
+    subdir = os.path.basename(os.path.normpath(subdir_path))
+    raw_files = find_raw_files(subdir_path)
+    qc = config['qc']
+    if qc and qc.get('exclude'):
+        failed = plate_qc.failed_files(subdir_path)
+        excluded = [path for path in raw_files if os.path.basename(path) in failed]
+        if excluded:
+            logger.warning("Pomijam %d płytek niespełniających kryteriów QC w %s: %s", len(excluded), subdir_path,
+                           [os.path.basename(path) for path in excluded])
+            raw_files = [path for path in raw_files if path not in excluded]
+    if not raw_files:
+        logger.warning("Brak plików źródłowych w podkatalogu '%s'; pomijam.", subdir_path)
+        return SubdirResult(subdir, [], [], 'brak plików źródłowych')
+
+    # Statystyki z częściowych agregatów płytek – czytane są tylko płytki nowe lub zmienione
+    loaded = {}
+    merged = plate_statistics(raw_files, loaded, config)
+    if not merged[0]:
+        logger.error("Brak poprawnych danych do scalenia.")
+        return SubdirResult(subdir, [], [], 'brak poprawnych danych do scalenia')
+
+    # Zbierz unikalne typy pomiarów w tym podkatalogu
+    measurement_types = sorted({measurement for _, measurement in merged[0]})
+    logger.info("W podkatalogu '%s' znaleziono typy pomiarów: %s", subdir_path, measurement_types)
+
+    if len(measurement_types) > 1 and callable(ratios):
+        ratios = ratios(measurement_types)
+    with_ratios = len(measurement_types) > 1 and bool(ratios)
+    if not with_ratios and len(measurement_types) > 1:
+        logger.info("Pominięto generowanie pliku %s w %s.", RATIOS_FILENAME, subdir_path)
+
+    # Podsumowanie: jeden wiersz na (Sample, Measurement) i na (Sample, ratio)
+    keys, merged_result = merged
+    summary = [summary_columns(
+        subdir, [sample for sample, _ in keys], [measurement for _, measurement in keys],
+        [''] * len(keys), merged_result,
+    )]
+
+    # Bootstrapowe przedziały ufności średnich (losowanie studzienek w obrębie grup)
+    ci = None
+    if config['bootstrap_resamples']:
+        ci = partial(bootstrap.bootstrap_ci, n_resamples=config['bootstrap_resamples'],
+                     confidence=config['confidence_level'],
+                     rng=bootstrap.subdir_rng(config['bootstrap_seed'], subdir))
+
+    outputs = []
+    if not config['write_merged'] and not with_ratios and ci is None:
+        logger.info("Pominięto generowanie pliku %s w %s (write_merged=false).", MERGED_FILENAME, subdir_path)
+        outputs.extend(write_summary_outputs(subdir_path, summary, config))
+        return SubdirResult(subdir, measurement_types, outputs, '', summary_table(summary))
+
+    # Scal wszystkie dane w tym podkatalogu (pliki już wczytane nie są czytane ponownie)
+    table = merge_data(raw_files, loaded, config)
+    if table is None:
+        return SubdirResult(subdir, [], [], 'brak poprawnych danych do scalenia')
+
+    if ci is not None:
+        codes, table_keys = table.group_codes(*partials.GROUP_COLUMNS)
+        low, high = ci(codes, table.value, len(table_keys))
+        index = {key: i for i, key in enumerate(table_keys)}
+        rows = np.array([index[key] for key in keys], dtype=np.intp)
+        summary[0].update(zip(CI_COLUMNS, (low[rows], high[rows])))
+
+    if config['write_merged']:
         merged_path = os.path.join(subdir_path, MERGED_FILENAME)
         if os.path.exists(merged_path):
             logger.info("Plik %s już istnieje i zostanie nadpisany w %s.", MERGED_FILENAME, subdir_path)
+        if len(measurement_types) == 1:
+            # Jeden typ pomiaru: compute Single Measurement Stats
+            stats_columns = compute_single_measurement_stats(table, stats, merged)
+        else:
+            # Kilka typów pomiaru: compute Multi Measurement Stats
+            stats_columns = compute_multi_measurement_stats(table, stats, merged)
+        outputs.extend(write_outputs(merged_path, merged_columns(table, stats_columns), formats))
 
-        # Scal wszystkie dane w tym podkatalogu
-        merged_rows, base_fieldnames = merge_data(raw_files)
-        if not merged_rows:
-            continue
+    if with_ratios:
+        pairs = ratio_pairs(ratios, measurement_types)
+        outputs.extend(compute_and_write_ratios(
+            subdir_path, table, measurement_types, pairs, stats, formats, summary, ci
+        ))
 
-        # Zbierz unikalne typy pomiarów w tym podkatalogu
-        measurement_types = sorted({r['Measurement'] for r in merged_rows})
-        logger.info("W podkatalogu '%s' znaleziono typy pomiarów: %s", subdir_path, measurement_types)
+    outputs.extend(write_summary_outputs(subdir_path, summary, config))
 
-        # Przygotuj dane do ewentualnego liczenia ratio
-        ratio_source_rows = [r.copy() for r in merged_rows]
+    return SubdirResult(subdir, measurement_types, outputs, '', summary_table(summary))
 
-        # Przygotuj listę kolumn do zapisu (bez '_float_value')
-        initial_fieldnames = [fn for fn in base_fieldnames if fn != '_float_value']
 
-        if len(measurement_types) == 1:
-            # Jeden typ pomiaru: compute Single Measurement Stats
-            compute_single_measurement_stats(merged_rows)
-            strip_auxiliary(merged_rows)
-
-            final_fieldnames = initial_fieldnames[:]
-            if 'Mean' not in final_fieldnames:
-                final_fieldnames.extend(['Mean', 'Std'])
-            write_data(merged_path, merged_rows, final_fieldnames)
-
-        elif len(measurement_types) == 2:
-            # Dwa typy pomiaru: compute Multi Measurement Stats
-            compute_multi_measurement_stats(merged_rows)
-            strip_auxiliary(merged_rows)
-
-            final_fieldnames = initial_fieldnames[:]
-            if 'Mean' not in final_fieldnames:
-                final_fieldnames.extend(['Mean', 'Std'])
-            write_data(merged_path, merged_rows, final_fieldnames)
-
-            # Pytamy użytkownika tylko raz o liczenie stosunków i wybór pomiarów
-            if not ratio_choice_asked:
-                choice = input(
-                    "Znaleziono dwa typy pomiarów w przynajmniej jednym podkatalogu. "
-                    "Czy chcesz obliczyć stosunki dla wszystkich podkatalogów? (t/n): "
-                ).strip().lower()
-                ratio_choice_asked = True
-                if choice == 't':
-                    ratio_enabled = True
-                    num = input(f"Podaj nazwę pomiaru, który ma być licznikiem spośród {measurement_types}: ").strip()
-                    den = input(f"Podaj nazwę pomiaru, który ma być mianownikiem spośród {measurement_types}: ").strip()
-                else:
-                    ratio_enabled = False
-
-            if ratio_enabled:
-                compute_and_write_ratios(subdir_path, ratio_source_rows, measurement_types, num, den)
-            else:
-                logger.info("Pominięto generowanie pliku %s w %s.", RATIOS_FILENAME, subdir_path)
+def _analyze_one(args):
+    """
+    Analizuje jeden podkatalog w procesie roboczym; wyjątki zamienia na SubdirResult z błędem.
+    Funkcja jest na poziomie modułu, aby można ją było przekazać do puli procesów.
+    """
+    subdir_path, ratios, config = args
+    try:
+        return analyze_subdir(subdir_path, ratios, config)
+    except Exception as e:
+        logger.exception("Błąd podczas analizy podkatalogu %s: %s", subdir_path, e)
+        return SubdirResult(os.path.basename(os.path.normpath(subdir_path)), [], [], str(e))
 
-        else:
-            logger.error(
-                "W podkatalogu '%s' nieobsługiwana liczba typów pomiarów: %d. Oczekiwano 1 lub 2.",
-                subdir_path, len(measurement_types)
-            )
+
+def analyze_all(subdirs=None, ratios=None, workers=None, config=None, interactive=None):
+    """
+    Główna funkcja:
+    Dla każdego podkatalogu w katalogu DATA_DIR (lub tylko dla podanych nazw w subdirs):
+      1. Znajduje wszystkie pliki kończące się na '_data.csv'.
+      2. Scala je w jeden data_merged.csv w danym podkatalogu.
+      3. Jeśli jest jeden typ pomiaru: oblicza Mean/Std per Sample.
+         Jeśli jest więcej typów pomiaru: oblicza Mean/Std per (Sample, Measurement), zapisuje merged,
+         a następnie (raz tylko) pyta, czy wygenerować ratios.csv i jakie pomiary użyć (należy wybrać spośród wszystkich podkatalogów).
+    config – konfiguracja analizy: None (plik analysis_config.CONFIG_FILE, jeśli istnieje),
+    ścieżka do pliku JSON albo słownik; ustala ratio, statystyki, formaty wyjściowe, liczbę
+    procesów, podkatalogi i przebieg czasowy. Argumenty subdirs, ratios i workers mają pierwszeństwo przed config.
+    ratios pozwala pominąć pytanie: False – bez ratios.csv, (licznik, mianownik) – użyj tych pomiarów,
+    lista par – policz każdą z nich, 'all' – wszystkie uporządkowane pary (macierz N×N),
+    None (domyślnie) – wartość z konfiguracji, a gdy i tam jej brak – zapytaj użytkownika.
+    interactive – czy wolno pytać użytkownika; domyślnie wg konfiguracji i tylko wtedy, gdy
+    standardowe wejście jest terminalem. Bez pytań nieustalone ratio oznacza brak ratios.csv.
+    workers – liczba procesów roboczych (podkatalogi są niezależne); 1 oznacza analizę sekwencyjną,
+    0 – tyle procesów, ile rdzeni CPU. Domyślnie używane jest ANALYSER_WORKERS. W trybie równoległym
+    pytanie o ratio zadawane jest przed analizą, na podstawie typów pomiarów odczytanych z plików.
+    Na koniec (gdy time_course w konfiguracji) zestawia podsumowania przeanalizowanych podkatalogów-punktów
+    czasowych (0h, 3h, ...; wartości z pamięci, nie z zaokrąglonego summary.csv) w time_course.csv
+    i kinetics.csv w DATA_DIR.
+    Zwraca listę SubdirResult (w kolejności podkatalogów).
+    """
+    config = analysis_config.resolve_config(config)
+    if subdirs is None:
+        subdirs = config['subdirs']
+    if ratios is None:
+        ratios = config['ratios']
+    if workers is None:
+        workers = config['workers']
+    if interactive is None:
+        interactive = config['interactive'] and sys.stdin is not None and sys.stdin.isatty()
+    if ratios is None and not interactive:
+        logger.info("Brak konfiguracji ratio i tryb bez pytań – %s nie będzie generowany.", RATIOS_FILENAME)
+        ratios = False
+
+    subdir_names = sorted(os.listdir(DATA_DIR)) if subdirs is None else list(subdirs)
+    subdir_paths = [
+        os.path.join(DATA_DIR, name) for name in subdir_names
+        if os.path.isdir(os.path.join(DATA_DIR, name))
+    ]
+
+    if workers is None:
+        workers = ANALYSER_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(subdir_paths)))
+
+    if workers == 1:
+        if ratios is None:
+            # Pytamy użytkownika tylko raz – przy pierwszym podkatalogu z dwoma typami pomiaru
+            answer = []
+
+            def ratios(measurement_types):
+                if not answer:
+                    answer.append(ask_ratio_measurements(measurement_types))
+                return answer[0]
+
+        results = [analyze_subdir(path, ratios, config) for path in subdir_paths]
+    else:
+        if ratios is None:
+            ratios = False
+            for path in subdir_paths:
+                measurement_types = scan_measurement_types(path)
+                if len(measurement_types) >= 2:
+                    ratios = ask_ratio_measurements(measurement_types)
+                    break
+        logger.info("Analiza %d podkatalogów w %d procesach", len(subdir_paths), workers)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_analyze_one, [(path, ratios, config) for path in subdir_paths]))
+        except Exception as e:
+            logger.exception("Błąd puli procesów: %s", e)
+            results = [
+                SubdirResult(os.path.basename(path), [], [], f'błąd puli procesów: {e}')
+                for path in subdir_paths
+            ]
+
+    failed = [r for r in results if r.error]
+    for r in results:
+        if not r.error:
+            logger.info("Podkatalog %s: typy pomiarów %s, zapisano %s", r.subdir, r.measurements, r.outputs)
+    if failed:
+        logger.warning("Nie udało się przeanalizować %d z %d podkatalogów:", len(failed), len(results))
+        for r in failed:
+            logger.warning("  %s: %s", r.subdir, r.error)
+
+    if config['time_course']:
+        try:
+            summaries = {r.subdir: r.summary for r in results if not r.error and r.summary is not None}
+            time_course.analyze_time_course(DATA_DIR, summaries)
+        except Exception as e:
+            logger.exception("Błąd podczas analizy przebiegu czasowego: %s", e)
+    return results
+
+
+def parse_args(argv=None):
+    """Argumenty wiersza poleceń trybu wsadowego (np. z crona)."""
+    parser = argparse.ArgumentParser(description='Analiza danych z katalogu data/.')
+    parser.add_argument('--config', help=f'plik konfiguracji JSON (domyślnie {analysis_config.CONFIG_FILE})')
+    parser.add_argument('--ratios', nargs=2, action='append', metavar=('LICZNIK', 'MIANOWNIK'),
+                        help='para pomiarów do ratios.csv (można podać wielokrotnie)')
+    parser.add_argument('--ratio-matrix', action='store_true', help='wszystkie pary pomiarów (macierz N×N)')
+    parser.add_argument('--no-ratios', action='store_true', help='nie generuj ratios.csv')
+    parser.add_argument('--workers', type=int, help='liczba procesów (0 = liczba rdzeni CPU)')
+    parser.add_argument('--subdirs', nargs='+', help='analizuj tylko te podkatalogi')
+    parser.add_argument('--batch', action='store_true', help='nie zadawaj żadnych pytań')
+    return parser.parse_args(argv)
 
 
 if __name__ == '__main__':
-    analyze_all()
+    args = parse_args()
+    analyze_all(
+        subdirs=args.subdirs,
+        ratios=False if args.no_ratios else (
+            analysis_config.ALL_RATIOS if args.ratio_matrix else
+            [tuple(pair) for pair in args.ratios] if args.ratios else None
+        ),
+        workers=args.workers,
+        config=args.config,
+        interactive=False if args.batch else None,
+    )
@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import contextlib
 import csv
+import functools
+import hashlib
+import json
+import mmap
 import os
 import sys
 import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import archive_io
+import columnar
+import plate_geometry
 
 # ------------------------- USTAWIENIA LOGOWANIA -------------------------
 
@@ -21,6 +35,48 @@ logger.addHandler(handler)
 DATA_DIR = 'data'
 MAPPING_DIR = 'mappings'
 ASSIGNMENT_FILE = os.path.join(MAPPING_DIR, 'assignment.csv')
+# Nagłówek, który mappings_assigner zapisuje w pierwszym wierszu assignment.csv
+ASSIGNMENT_HEADER = ('input_file', 'mapping_file')
+INPUT_ENCODING = 'cp1250'
+# Silnik parsowania plików wejściowych: 'mmap' (skanowanie bajtów w pliku zmapowanym
+# do pamięci; szybszy, zwłaszcza dla dużych eksportów; pliki skompresowane i z archiwów zip
+# czyta strumieniowo) lub 'stream' (tekstowo, linia po linii)
+PARSER_BACKEND = 'mmap'
+# Domyślna liczba procesów dla generate_all_from_assignment (0 = wszystkie rdzenie)
+GENERATOR_WORKERS = 1
+# Wersja formatu wyjściowego – zmiana unieważnia wszystkie wpisy manifestu
+GENERATOR_VERSION = '2'
+MANIFEST_FILE = os.path.join(DATA_DIR, '.generator_manifest.json')
+# Formaty plików wyjściowych: 'csv' (wierszowy *_data.csv) i/lub 'npz' (kolumnowy *_data.npz)
+OUTPUT_FORMATS = ('csv',)
+OUTPUT_SUFFIXES = {'csv': '_data.csv', 'npz': '_data.npz'}
+OUTPUT_COLUMNS = ['Sample', 'Plate', 'Row', 'Column', 'Well', 'Measurement', 'Value']
+# Typy kolumn w formacie kolumnowym (str = kolumna słownikowa)
+OUTPUT_DTYPES = {
+    'Sample': str, 'Plate': str, 'Row': str, 'Column': 'int16',
+    'Well': str, 'Measurement': str, 'Value': 'float64',
+}
+_RESULTS_MARKER = b'Results for'
+_PLATE_INFO_MARKER = b'Plate information'
+MEASUREMENT_DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+# Podsumowania szeregów czasowych zapisywane dla eksportów kinetycznych / z powtórzeniami
+KINETIC_SUMMARIES = ('max', 'slope', 'auc')
+KINETICS_SUFFIX = '_kinetics.npz'
+
+# Skompilowane mapowanie: słownik {studzienka: próbka}, gęste listy samples/wells
+# indeksowane numerem studzienki oraz geometria płytki (patrz _compile_mapping)
+CompiledMapping = namedtuple('CompiledMapping', ['mapping', 'samples', 'wells', 'geometry'])
+
+# Blok wyników: nazwa pomiaru, pola sekcji "Plate information" poprzedzającej blok,
+# wiersze [(etykieta_wiersza, [komórki kolumn]), ...] i geometria wykryta z nagłówka kolumn
+ResultBlock = namedtuple('ResultBlock', ['measurement', 'info', 'rows', 'geometry'])
+
+# Cała płytka: nazwy pomiarów, etykiety cykli (Repeat, Kinetics), oś czasu [s],
+# wartości o kształcie (cykl × studzienka × pomiar), NaN = brak odczytu, oraz geometria
+PlateData = namedtuple('PlateData', ['measurements', 'cycles', 'times', 'values', 'geometry'])
+
+# Pamięć podręczna mapowań: {ścieżka_bezwzględna: ((mtime_ns, rozmiar), CompiledMapping)}
+_MAPPING_CACHE = {}
 
 # ------------------------- FUNKCJE POMOCNICZE -------------------------
 
@@ -43,9 +99,12 @@ def load_assignments(path: str = ASSIGNMENT_FILE):
                 continue
             infile = row[0].strip()
             mapfile = row[1].strip()
+            if idx == 1 and (infile, mapfile) == ASSIGNMENT_HEADER:
+                continue
             if infile and mapfile:
-                infile_norm = os.path.normpath(infile)
-                mapfile_norm = os.path.normpath(mapfile)
+                # Ścieżki zapisane na Windows ('input\\0h\\...') działają też na Linuksie
+                infile_norm = os.path.normpath(infile.replace('\\', '/'))
+                mapfile_norm = os.path.normpath(mapfile.replace('\\', '/'))
                 assignments.append((infile_norm, mapfile_norm))
             else:
                 logger.warning('Pominięto wiersz %d w %s – puste ścieżki', idx, path)
@@ -54,16 +113,18 @@ def load_assignments(path: str = ASSIGNMENT_FILE):
     return assignments
 
 
-def read_mapping(path: str) -> dict:
+def _read_mapping_file(path: str) -> tuple:
     """
     Wczytuje mapowanie z pliku CSV. Zakłada, że:
     - Pierwszy wiersz: pusta komórka w pierwszej kolumnie, a w kolejnych nagłówki "01","02",...,"12"
+      (dla płytek 384/1536: "01"–"24" / "01"–"48")
     - Kolejne wiersze: litera_wiersza, nazwa_próbki_kolumna_01, nazwa_próbki_kolumna_02, ..., nazwa_próbki_kolumna_12
-    Zwraca słownik tylko dla niepustych próbek: {'A01': '1M_CAA', 'A02': '2M_CAA', ...}
+    Zwraca krotkę (słownik tylko dla niepustych próbek: {'A01': '1M_CAA', 'A02': '2M_CAA', ...},
+    liczba kolumn w nagłówku).
     """
     if not os.path.exists(path):
         logger.error('Plik mapowania nie istnieje: %s', path)
-        return {}
+        return {}, 0
 
     mapping = {}
     try:
@@ -72,9 +133,10 @@ def read_mapping(path: str) -> dict:
             header = next(reader, None)
             if not header or len(header) < 2:
                 logger.error('Nieprawidłowy format nagłówka w pliku mapującym: %s', path)
-                return {}
+                return {}, 0
 
             cols = header[1:]  # np. ["01","02",..., "12"]
+            n_columns = sum(1 for c in cols if c.strip())
             for row_idx, row in enumerate(reader, start=2):
                 if not row or len(row) < 2:
                     continue
@@ -92,102 +154,480 @@ def read_mapping(path: str) -> dict:
                         mapping[well] = sample_name
     except Exception as e:
         logger.error('Błąd podczas czytania mapowania %s: %s', path, e)
-        return {}
+        return {}, 0
 
     logger.debug('Wczytano %d wpisów mapujących z %s', len(mapping), path)
-    return mapping
+    return mapping, n_columns
 
 
-def parse_input(path: str) -> list:
+def _compile_mapping(mapping: dict, n_columns: int = 0) -> CompiledMapping:
     """
-    Parsuje plik wejściowy EnSpire i wyciąga wszystkie rekordy:
-    [(row_label, column_index, measurement_name, value), ...]
-    Szuka bloków zaczynających się od linii "Results for Meas X - ...", następnie
-    czyta kolejne 8 wierszy (A–H) z wartościami w kolumnach 01–12.
+    Zamienia słownik {'A01': próbka, ...} na gęste listy indeksowane numerem
+    studzienki (row_index * columns + column_index - 1). Geometria płytki
+    rozpoznawana jest po liczbie kolumn nagłówka (12, 24 lub 48; domyślnie 96 dołków).
     """
-    results = []
-    if not os.path.exists(path):
-        logger.error('Plik wejściowy nie istnieje: %s', path)
-        return results
+    geometry = plate_geometry.geometry_for_columns(n_columns) or plate_geometry.DEFAULT_GEOMETRY
+    wells = plate_geometry.well_names(geometry)
+    samples = [mapping.get(well, '') for well in wells]
+    return CompiledMapping(mapping, samples, wells, geometry)
+
 
-    encoding_used = 'cp1250'
+def load_compiled_mapping(path: str) -> CompiledMapping:
+    """
+    Zwraca skompilowane mapowanie z pamięci podręcznej lub wczytuje je z pliku.
+    Wpis w _MAPPING_CACHE jest ważny, dopóki nie zmieni się mtime ani rozmiar pliku;
+    w przeciwnym razie jest usuwany i mapowanie wczytywane jest ponownie.
+    """
+    key = os.path.abspath(path)
     try:
-        with open(path, encoding=encoding_used, errors='replace') as f:
-            lines = [line.rstrip('\n') for line in f]
-    except Exception as e:
-        logger.error("Nie udało się wczytać '%s' z kodowaniem %s: %s", path, encoding_used, e)
-        return results
+        st = os.stat(path)
+    except OSError:
+        _MAPPING_CACHE.pop(key, None)
+        logger.error('Plik mapowania nie istnieje: %s', path)
+        return _compile_mapping({})
+
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _MAPPING_CACHE.get(key)
+    if cached is not None and cached[0] == signature:
+        logger.debug('Mapowanie %s pobrane z pamięci podręcznej', path)
+        return cached[1]
+
+    compiled = _compile_mapping(*_read_mapping_file(path))
+    _MAPPING_CACHE[key] = (signature, compiled)
+    return compiled
+
+
+def read_mapping(path: str) -> dict:
+    """
+    Zwraca mapowanie z pliku CSV jako słownik {'A01': '1M_CAA', 'A02': '2M_CAA', ...}
+    (tylko niepuste próbki). Korzysta z pamięci podręcznej load_compiled_mapping.
+    """
+    return dict(load_compiled_mapping(path).mapping)
+
 
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.startswith('Results for'):
+def _measurement_name(line: str) -> str:
+    """Wyciąga nazwę pomiaru z linii "Results for Meas X - ..."."""
+    try:
+        return line.split('Results for')[1].split('-')[0].strip()
+    except Exception:
+        return line
+
+
+def _parse_plate_info(names_line: str, values_line: str) -> dict:
+    """
+    Zamienia parę linii z sekcji "Plate information" (nazwy pól i wartości)
+    na słownik, np. {'Plate': '1', 'Repeat': '1', 'Kinetics': '1', 'Measurement date': ...}.
+    """
+    names = next(csv.reader([names_line]), [])
+    values = next(csv.reader([values_line]), [])
+    return {name.strip(): value.strip() for name, value in zip(names, values) if name.strip()}
+
+
+@functools.lru_cache(maxsize=64)
+def _block_geometry(header_line):
+    """
+    Rozpoznaje geometrię płytki z linii nagłówka kolumn bloku (",01,02,...,12,").
+    Przyjmuje str lub bytes; dla nieznanej liczby kolumn zwraca None.
+    """
+    sep = b',' if isinstance(header_line, bytes) else ','
+    n_columns = sum(1 for cell in header_line.split(sep)[1:] if cell.strip())
+    return plate_geometry.geometry_for_columns(n_columns)
+
+
+def _iter_cell_records(row_label: str, cells: list, meas: str, path: str):
+    """
+    Zamienia komórki jednego wiersza danych bloku (kolumny 01, 02, ...) na rekordy
+    (row_label, column_index, measurement_name, value).
+    Komórki mogą być typu str albo bytes – float() przyjmuje oba.
+    """
+    for c_idx, val in enumerate(cells, start=1):
+        if val and val.strip():
             try:
-                meas = line.split('Results for')[1].split('-')[0].strip()
-            except Exception:
-                meas = line
-            logger.debug('Znaleziono pomiar: %s w pliku %s (linia %d)', meas, path, i+1)
+                numeric_value = float(val)
+            except ValueError:
+                if isinstance(val, bytes):
+                    val = val.decode(INPUT_ENCODING, errors='replace')
+                logger.warning('Nieprawidłowa wartość "%s" w %s (wiersz %s, kolumna %02d)', val, path, row_label, c_idx)
+                continue
+            yield (row_label, c_idx, meas, numeric_value)
 
-            i += 1
-            if i >= len(lines):
-                break
-            if not lines[i].startswith(','):
+
+def _iter_blocks_stream(path: str):
+    """
+    Backend 'stream': czyta plik tekstowo, jednokrotnie, linia po linii –
+    w pamięci trzymany jest tylko bieżący blok wyników. Pliki skompresowane
+    i elementy archiwów zip są dekompresowane strumieniowo.
+    """
+    try:
+        f = archive_io.open_input_text(path, INPUT_ENCODING)
+    except Exception as e:
+        logger.error("Nie udało się wczytać '%s' z kodowaniem %s: %s", path, INPUT_ENCODING, e)
+        return
+
+    with f:
+        info = {}
+        info_names = None
+        info_lines_left = 0
+        block = None
+        expect_header = False
+        rows_left = 0
+        for line_no, line in enumerate(f, start=1):
+            line = line.rstrip('\n')
+            if rows_left:
+                rows_left -= 1
+                parts = line.split(',')
+                if len(parts) >= 2:
+                    block.rows.append((parts[0].strip(), parts[1:block.geometry.columns + 1]))
+                if not rows_left:
+                    yield block
+                    block = None
                 continue
 
-            for row_offset in range(1, 9):
-                if i + row_offset >= len(lines):
-                    break
-                data_line = lines[i + row_offset]
-                parts = data_line.split(',')
-                if len(parts) < 2:
+            if expect_header:
+                expect_header = False
+                geometry = _block_geometry(line) if line.startswith(',') else None
+                if geometry is not None:
+                    block = block._replace(geometry=geometry)
+                    rows_left = len(geometry.rows)
                     continue
-                row_label = parts[0].strip()
-                values = parts[1:13]  # kolumny 01–12
-                for c_idx, val in enumerate(values, start=1):
-                    if val and val.strip():
-                        try:
-                            numeric_value = float(val.replace(',', '.'))
-                        except ValueError:
-                            logger.warning('Nieprawidłowa wartość "%s" w %s (wiersz %s, kolumna %02d)', val, path, row_label, c_idx)
-                            continue
-                        results.append((row_label, c_idx, meas, numeric_value))
-
-            i += 9
+                if line.startswith(','):
+                    logger.warning('Nieobsługiwany nagłówek kolumn bloku %s w %s (linia %d); pomijam blok.',
+                                   block.measurement, path, line_no)
+                block = None
+
+            if info_lines_left:
+                info_lines_left -= 1
+                if info_lines_left:
+                    info_names = line
+                else:
+                    info = _parse_plate_info(info_names, line)
+                continue
+
+            stripped = line.strip()
+            if stripped == 'Plate information':
+                info_lines_left = 2
+            elif stripped.startswith('Results for'):
+                block = ResultBlock(_measurement_name(stripped), info, [], None)
+                expect_header = True
+                logger.debug('Znaleziono pomiar: %s w pliku %s (linia %d)', block.measurement, path, line_no)
+
+        if block is not None and rows_left:
+            yield block
+
+
+def _scan_blocks(buf, path: str):
+    """
+    Wyszukuje bloki wyników w buforze bajtów (mmap lub bytes) – rdzeń backendu 'mmap'.
+    """
+    size = len(buf)
+    pos = 0
+    info_pos, info = -1, {}
+    labels = {}  # {etykieta wiersza (bytes): etykieta zdekodowana}
+    while True:
+        idx = buf.find(_RESULTS_MARKER, pos)
+        if idx < 0:
+            break
+        line_start = buf.rfind(b'\n', 0, idx) + 1
+        line_end = buf.find(b'\n', idx)
+        if line_end < 0:
+            line_end = size
+        pos = line_end + 1
+        # Znacznik musi rozpoczynać linię (dopuszczalne wiodące białe znaki)
+        if buf[line_start:idx].strip():
             continue
 
-        i += 1
+        meas_line = buf[idx:line_end].decode(INPUT_ENCODING, errors='replace').strip()
+        meas = _measurement_name(meas_line)
+        logger.debug('Znaleziono pomiar: %s w pliku %s (bajt %d)', meas, path, idx)
 
-    logger.debug('Wyników pomiaru w pliku %s: %d rekordów', path, len(results))
-    return results
+        if pos >= size or buf[pos:pos + 1] != b',':
+            continue
+        header_end = buf.find(b'\n', pos)
+        if header_end < 0:
+            break
+        geometry = _block_geometry(buf[pos:header_end].rstrip(b'\r'))
+        if geometry is None:
+            logger.warning('Nieobsługiwany nagłówek kolumn bloku %s w %s (bajt %d); pomijam blok.',
+                           meas, path, pos)
+            pos = header_end + 1
+            continue
+
+        # Najbliższa wcześniejsza sekcja "Plate information" opisuje ten blok
+        found = buf.rfind(_PLATE_INFO_MARKER, 0, idx)
+        if found != info_pos:
+            info_pos, info = found, {}
+            if found >= 0:
+                info_lines = buf[found:idx].decode(INPUT_ENCODING, errors='replace').splitlines()
+                if len(info_lines) >= 3:
+                    info = _parse_plate_info(info_lines[1], info_lines[2])
+
+        # Wiersze danych bloku: jeden wycinek bufora dzielony na linie, a linie na komórki
+        rows_start = rows_end = header_end + 1
+        for _ in range(len(geometry.rows)):
+            if rows_end >= size:
+                break
+            row_end = buf.find(b'\n', rows_end)
+            rows_end = size if row_end < 0 else row_end + 1
+        block = ResultBlock(meas, info, [], geometry)
+        for line in buf[rows_start:rows_end].split(b'\n'):
+            parts = line.rstrip(b'\r').split(b',')
+            if len(parts) < 2:
+                continue
+            raw_label = parts[0].strip()
+            row_label = labels.get(raw_label)
+            if row_label is None:
+                row_label = labels[raw_label] = raw_label.decode(INPUT_ENCODING, errors='replace')
+            block.rows.append((row_label, parts[1:geometry.columns + 1]))
+        pos = rows_end
+        yield block
 
 
-def generate_data(input_file: str, mapping_file: str) -> str:
+def _iter_blocks_mmap(path: str):
     """
-    Generuje plik CSV z połączonych danych z pliku wejściowego i mapowania.
-    Plik wyjściowy zapisywany jest w strukturze data/[ścieżka_z_input_po_input/...].
-    Zwraca ścieżkę do wygenerowanego pliku lub pusty string w razie błędu.
+    Backend 'mmap': mapuje plik do pamięci i wyszukuje znaczniki "Results for"
+    oraz wiersze danych na poziomie bajtów. Dekodowane (cp1250) są tylko nazwa
+    pomiaru, nagłówek "Plate information" bloku i etykiety wierszy – komórki z wartościami
+    pozostają bytes i są zamieniane na liczby hurtowo, całym blokiem (_decode_block),
+    a pozostałe linie nie są w ogóle dekodowane.
+    Pliki skompresowane i elementy archiwów zip nie dają się zmapować – są
+    czytane strumieniowo backendem 'stream', żeby nie trzymać w pamięci całej
+    zdekompresowanej zawartości.
     """
-    if not os.path.exists(input_file):
-        logger.error('Plik wejściowy nie znaleziony: %s', input_file)
-        return ''
+    if not archive_io.is_plain_file(path):
+        yield from _iter_blocks_stream(path)
+        return
 
-    if not os.path.exists(mapping_file):
-        logger.error('Plik mapujący nie znaleziony: %s', mapping_file)
-        return ''
+    try:
+        f = open(path, 'rb')
+    except Exception as e:
+        logger.error("Nie udało się otworzyć '%s': %s", path, e)
+        return
 
-    logger.info('Przetwarzanie:\n  Wejście:  %s\n  Mapowanie: %s', input_file, mapping_file)
-    mapping = read_mapping(mapping_file)
-    if not mapping:
-        logger.warning('Mapowanie jest puste – nie zapiszę pliku wyjściowego dla %s', input_file)
-        return ''
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.error("Nie udało się zmapować '%s' do pamięci: %s", path, e)
+            return
 
-    data = parse_input(input_file)
-    if not data:
-        logger.warning('Brak danych do zapisania z pliku %s', input_file)
-        return ''
+        with mm:
+            yield from _scan_blocks(mm, path)
+
+
+PARSER_BACKENDS = {
+    'stream': _iter_blocks_stream,
+    'mmap': _iter_blocks_mmap,
+}
+
+
+def iter_input_blocks(path: str, backend: str = None):
+    """
+    Parsuje plik wejściowy EnSpire i zwraca (yield) kolejne bloki wyników ResultBlock.
+    Szuka bloków zaczynających się od linii "Results for Meas X - ...", rozpoznaje
+    format płytki (96/384/1536) z nagłówka kolumn i czyta odpowiednio 8/16/32 wierszy.
+    backend wybiera silnik parsowania z PARSER_BACKENDS ('stream' lub 'mmap');
+    domyślnie używany jest PARSER_BACKEND.
+    """
+    backend = backend or PARSER_BACKEND
+    parser = PARSER_BACKENDS.get(backend)
+    if parser is None:
+        logger.error('Nieznany backend parsera: %s (dostępne: %s)', backend, ', '.join(PARSER_BACKENDS))
+        return
+
+    if not archive_io.input_exists(path):
+        logger.error('Plik wejściowy nie istnieje: %s', path)
+        return
+
+    yield from parser(path)
+
+
+def iter_input_records(path: str, backend: str = None):
+    """
+    Parsuje plik wejściowy EnSpire i zwraca (yield) kolejne rekordy
+    (row_label, column_index, measurement_name, value).
+    Dla eksportów kinetycznych / z powtórzeniami rekordy kolejnych cykli
+    mają tę samą nazwę pomiaru – do analizy w czasie służy read_plate.
+    """
+    count = 0
+    for block in iter_input_blocks(path, backend):
+        for row_label, cells in block.rows:
+            for record in _iter_cell_records(row_label, cells, block.measurement, path):
+                count += 1
+                yield record
 
-    plate_name = os.path.splitext(os.path.basename(input_file))[0]
-    out_filename = f'{plate_name}_data.csv'
+    logger.debug('Wyników pomiaru w pliku %s: %d rekordów', path, count)
+
+
+def parse_input(path: str, backend: str = None) -> list:
+    """
+    Parsuje plik wejściowy EnSpire i wyciąga wszystkie rekordy:
+    [(row_label, column_index, measurement_name, value), ...]
+    Wygodna nakładka na iter_input_records, gdy potrzebna jest pełna lista.
+    """
+    return list(iter_input_records(path, backend))
+
+
+@functools.lru_cache(maxsize=None)
+def _row_index(geometry) -> dict:
+    """Słownik {etykieta_wiersza: indeks} dla geometrii płytki (liczony raz na geometrię)."""
+    return {label: idx for idx, label in enumerate(geometry.rows)}
+
+
+def _decode_block(block: ResultBlock, path: str) -> np.ndarray:
+    """
+    Dekoduje blok wyników bezpośrednio do tablicy 2-D (wiersz × kolumna), NaN = brak odczytu.
+    Komórki wszystkich wierszy trafiają do jednej płaskiej listy (puste komórki jako 'nan'),
+    zamienianej na liczby jednym wywołaniem np.asarray(..., dtype=float) i przekształcanej
+    do kształtu płytki; dopiero gdy blok zawiera nieprawidłowe wartości (lub komórki
+    z samymi spacjami), komórki sprawdzane są pojedynczo.
+    """
+    geometry = block.geometry
+    n_rows, n_columns = len(geometry.rows), geometry.columns
+    row_index = _row_index(geometry)
+    # Komórki są typu str (backend 'stream') albo bytes (backend 'mmap')
+    missing = b'nan' if block.rows and isinstance(block.rows[0][1][0], bytes) else 'nan'
+
+    flat = [missing] * (n_rows * n_columns)
+    for row_label, cells in block.rows:
+        row_idx = row_index.get(row_label)
+        if row_idx is not None:
+            start = row_idx * n_columns
+            flat[start:start + len(cells)] = [cell or missing for cell in cells]
+    try:
+        return np.asarray(flat, dtype=float).reshape(n_rows, n_columns)
+    except ValueError:
+        values = np.full((n_rows, n_columns), np.nan)
+        for row_label, row_cells in block.rows:
+            row_idx = row_index.get(row_label)
+            if row_idx is None:
+                continue
+            for _, col_idx, _, value in _iter_cell_records(row_label, row_cells, block.measurement, path):
+                values[row_idx, col_idx - 1] = value
+        return values
+
+
+def _cycle_times(dates: list) -> np.ndarray:
+    """
+    Zamienia pola "Measurement date" kolejnych cykli na oś czasu w sekundach od pierwszego cyklu.
+    Jeśli daty nie dają się odczytać albo nie rosną ściśle, zwraca numery cykli (0, 1, 2, ...).
+    """
+    cycles = np.arange(len(dates), dtype=float)
+    if len(dates) < 2:
+        return cycles
+    try:
+        stamps = [datetime.strptime(d, MEASUREMENT_DATE_FORMAT) for d in dates]
+    except (TypeError, ValueError):
+        return cycles
+    seconds = np.array([(s - stamps[0]).total_seconds() for s in stamps])
+    if len(seconds) > 1 and np.all(np.diff(seconds) > 0):
+        return seconds
+    return cycles
+
+
+def read_plate(path: str, backend: str = None):
+    """
+    Wczytuje cały plik wejściowy do zwartej tablicy PlateData.values o kształcie
+    (cykl × studzienka × pomiar). n-te wystąpienie bloku danego pomiaru to n-ty cykl
+    (powtórzenie / odczyt kinetyczny); pojedynczy odczyt daje jeden cykl.
+    Geometria płytki (96/384/1536) pochodzi z pierwszego bloku; bloki o innej
+    geometrii są pomijane. Zwraca None, gdy plik nie zawiera żadnych bloków wyników.
+    """
+    geometry = None
+    measurements = []
+    meas_index = {}
+    occurrences = []
+    cycle_info = []
+    decoded = []  # (cykl, pomiar, tablica wiersz × kolumna)
+    for block in iter_input_blocks(path, backend):
+        if geometry is None:
+            geometry = block.geometry
+        elif block.geometry != geometry:
+            logger.warning('Blok %s w %s ma inny format płytki niż pierwszy blok; pomijam.', block.measurement, path)
+            continue
+        m_idx = meas_index.setdefault(block.measurement, len(meas_index))
+        if m_idx == len(measurements):
+            measurements.append(block.measurement)
+            occurrences.append(0)
+        cycle = occurrences[m_idx]
+        occurrences[m_idx] += 1
+        if cycle == len(cycle_info):
+            cycle_info.append(block.info)
+        decoded.append((cycle, m_idx, _decode_block(block, path)))
+
+    if not decoded:
+        return None
+
+    values = np.full((len(cycle_info), plate_geometry.well_count(geometry), len(measurements)), np.nan)
+    for cycle, m_idx, grid in decoded:
+        values[cycle, :, m_idx] = grid.ravel()
+
+    cycles = [(info.get('Repeat', ''), info.get('Kinetics', '')) for info in cycle_info]
+    times = _cycle_times([info.get('Measurement date') for info in cycle_info])
+    logger.debug('Płytka %s: %d cykli, pomiary %s', path, len(cycle_info), measurements)
+    return PlateData(measurements, cycles, times, values, geometry)
+
+
+def kinetic_summary(plate) -> dict:
+    """
+    Wektorowo liczy podsumowania szeregów czasowych wszystkich studzienek i pomiarów naraz.
+    Zwraca {statystyka: tablica (studzienka × pomiar)} dla statystyk z KINETIC_SUMMARIES:
+    max – maksimum, slope – nachylenie prostej MNK względem czasu (jednostka: 1/s
+    lub 1/cykl), auc – pole pod krzywą metodą trapezów (pomija odcinki z brakami).
+    """
+    v = plate.values
+    t = np.asarray(plate.times, dtype=float)[:, None, None]
+    finite = np.isfinite(v)
+    n = finite.sum(axis=0)
+    v0 = np.where(finite, v, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        v_max = np.where(n > 0, np.where(finite, v, -np.inf).max(axis=0), np.nan)
+
+        t_mean = (t * finite).sum(axis=0) / n
+        v_mean = v0.sum(axis=0) / n
+        dt = np.where(finite, t - t_mean, 0.0)
+        cov = (dt * (v0 - v_mean)).sum(axis=0)
+        var = (dt * dt).sum(axis=0)
+        slope = np.where((n >= 2) & (var > 0), cov / var, np.nan)
+
+        pair = finite[1:] & finite[:-1]
+        segments = np.where(pair, (v0[1:] + v0[:-1]) / 2 * np.diff(t, axis=0), 0.0)
+        auc = np.where(pair.any(axis=0), segments.sum(axis=0), np.nan)
+
+    summary = {'max': v_max, 'slope': slope, 'auc': auc}
+    return {stat: summary[stat] for stat in KINETIC_SUMMARIES}
+
+
+def write_kinetics(path: str, plate, compiled: CompiledMapping):
+    """Zapisuje pełne szeregi czasowe płytki (cykl × studzienka × pomiar) do pliku .npz."""
+    with open(path, 'wb') as f:
+        np.savez_compressed(
+            f,
+            values=plate.values,
+            times=plate.times,
+            cycles=np.array(plate.cycles, dtype=str),
+            measurements=np.array(plate.measurements, dtype=str),
+            wells=np.array(compiled.wells, dtype=str),
+            samples=np.array(compiled.samples, dtype=str),
+        )
+
+
+def output_path_for(input_file: str, fmt: str = 'csv') -> str:
+    """
+    Wyznacza ścieżkę pliku wyjściowego dla pliku wejściowego:
+    data/[ścieżka_z_input_po_input/...]/<nazwa_płytki>_data.csv (lub _data.npz dla fmt='npz').
+    """
+    plate_name = archive_io.base_name(input_file)
+    out_filename = f'{plate_name}{OUTPUT_SUFFIXES[fmt]}'
+
+    archive, member = archive_io.split_archive_path(input_file)
+    if archive is not None:
+        # Archiwum zip traktujemy jak katalog input/: data/[katalog_w_archiwum/...]
+        member_dir = os.path.dirname(member.replace('/', os.sep))
+        out_dir = os.path.join(DATA_DIR, member_dir or archive_io.base_name(archive))
+        return os.path.join(out_dir, out_filename)
 
     input_dir = os.path.dirname(input_file)
     normalized_input_dir = os.path.normpath(input_dir)
@@ -206,51 +646,277 @@ def generate_data(input_file: str, mapping_file: str) -> str:
     if rel_dir and rel_dir != os.curdir:
         out_dir = os.path.join(DATA_DIR, rel_dir)
 
+    return os.path.join(out_dir, out_filename)
+
+
+def _file_digest(path: str) -> str:
+    """
+    Zwraca skrót SHA-256 (zdekompresowanej) zawartości pliku, także elementu archiwum zip,
+    lub pusty string, gdy pliku nie da się odczytać.
+    """
+    digest = hashlib.sha256()
+    try:
+        with archive_io.open_input(path) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except OSError:
+        return ''
+    return digest.hexdigest()
+
+
+def load_manifest(path: str = MANIFEST_FILE) -> dict:
+    """
+    Wczytuje manifest generatora: {ścieżka_wyjściowa: {input, input_sha256, mapping, mapping_sha256, generator_version}}.
+    Brak pliku lub błąd odczytu oznacza pusty manifest (wszystko zostanie wygenerowane ponownie).
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning('Nie udało się wczytać manifestu %s (%s); generuję wszystko od nowa.', path, e)
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_FILE):
+    """Zapisuje manifest atomowo (plik tymczasowy + os.replace)."""
+    try:
+        os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error('Nie udało się zapisać manifestu %s: %s', path, e)
+
+
+def _manifest_entry(infile: str, mapfile: str, digests: dict) -> dict:
+    """Buduje wpis manifestu dla pary; digests to pamięć podręczna skrótów w obrębie jednego przebiegu."""
+    for p in (infile, mapfile):
+        if p not in digests:
+            digests[p] = _file_digest(p)
+    return {
+        'input': infile,
+        'input_sha256': digests[infile],
+        'mapping': mapfile,
+        'mapping_sha256': digests[mapfile],
+        'generator_version': GENERATOR_VERSION,
+        'formats': list(OUTPUT_FORMATS),
+    }
+
+
+def generate_data(input_file: str, mapping_file: str, formats=None) -> str:
+    """
+    Generuje plik CSV z połączonych danych z pliku wejściowego i mapowania.
+    Plik wyjściowy zapisywany jest w strukturze data/[ścieżka_z_input_po_input/...].
+    formats – krotka formatów wyjściowych ('csv', 'npz'); domyślnie OUTPUT_FORMATS.
+    Format 'npz' zapisuje obok kolumnowy plik *_data.npz (patrz moduł columnar).
+    Zwraca ścieżkę do pliku w pierwszym z formatów lub pusty string w razie błędu.
+    """
+    formats = tuple(formats or OUTPUT_FORMATS)
+    unknown = [fmt for fmt in formats if fmt not in OUTPUT_SUFFIXES]
+    if unknown:
+        logger.error('Nieznane formaty wyjściowe: %s (dostępne: %s)', unknown, ', '.join(OUTPUT_SUFFIXES))
+        return ''
+
+    if not archive_io.input_exists(input_file):
+        logger.error('Plik wejściowy nie znaleziony: %s', input_file)
+        return ''
+
+    if not os.path.exists(mapping_file):
+        logger.error('Plik mapujący nie znaleziony: %s', mapping_file)
+        return ''
+
+    logger.info('Przetwarzanie:\n  Wejście:  %s\n  Mapowanie: %s', input_file, mapping_file)
+    compiled = load_compiled_mapping(mapping_file)
+    if not compiled.mapping:
+        logger.warning('Mapowanie jest puste – nie zapiszę pliku wyjściowego dla %s', input_file)
+        return ''
+
+    plate = read_plate(input_file)
+    if plate is None:
+        logger.warning('Brak danych do zapisania z pliku %s', input_file)
+        return ''
+    if plate.geometry != compiled.geometry:
+        logger.error('Format płytki w %s (%d dołków) nie zgadza się z mapowaniem %s (%d dołków)',
+                     input_file, plate_geometry.well_count(plate.geometry),
+                     mapping_file, plate_geometry.well_count(compiled.geometry))
+        return ''
+
+    plate_name = archive_io.base_name(input_file)
+    out_paths = {fmt: output_path_for(input_file, fmt) for fmt in formats}
+    out_path = out_paths[formats[0]]
+    out_dir = os.path.dirname(out_path)
+
     try:
         os.makedirs(out_dir, exist_ok=True)
     except Exception as e:
         logger.error('Nie udało się utworzyć katalogu %s: %s', out_dir, e)
         return ''
 
-    out_path = os.path.join(out_dir, out_filename)
+    if len(plate.cycles) > 1:
+        # Eksport kinetyczny / z powtórzeniami: pełne szeregi do *_kinetics.npz,
+        # a do tabeli wynikowej trafiają podsumowania per studzienka, np. "Meas A [slope]"
+        summary = kinetic_summary(plate)
+        measurements = [f'{meas} [{stat}]' for stat in summary for meas in plate.measurements]
+        matrix = np.concatenate(list(summary.values()), axis=1)
+        kinetics_path = os.path.join(out_dir, f'{plate_name}{KINETICS_SUFFIX}')
+        try:
+            write_kinetics(kinetics_path, plate, compiled)
+        except Exception as e:
+            logger.error('Błąd podczas zapisywania pliku %s: %s', kinetics_path, e)
+            return ''
+        logger.info('Zapisano %d cykli pomiarów do: %s', len(plate.cycles), kinetics_path)
+    else:
+        measurements = plate.measurements
+        matrix = plate.values[0]
 
     try:
-        with open(out_path, 'w', newline='', encoding='utf-8') as fout:
-            writer = csv.writer(fout)
-            writer.writerow(['Sample', 'Plate', 'Row', 'Column', 'Well', 'Measurement', 'Value'])
-            for row_label, col_idx, meas, value in data:
-                well = f'{row_label}{col_idx:02d}'
-                sample = mapping.get(well, '')
-                writer.writerow([sample, plate_name, row_label, col_idx, well, meas, value])
+        with contextlib.ExitStack() as stack:
+            writer = None
+            if 'csv' in formats:
+                fout = stack.enter_context(open(out_paths['csv'], 'w', newline='', encoding='utf-8'))
+                writer = csv.writer(fout)
+                writer.writerow(OUTPUT_COLUMNS)
+            builder = columnar.TableBuilder(OUTPUT_DTYPES) if 'npz' in formats else None
+
+            samples, wells = compiled.samples, compiled.wells
+            row_labels, n_columns = plate.geometry
+            for meas, column in zip(measurements, matrix.T.tolist()):
+                for well_idx, value in enumerate(column):
+                    if value != value:  # NaN – brak odczytu
+                        continue
+                    row_idx, col_idx = divmod(well_idx, n_columns)
+                    row = (samples[well_idx], plate_name, row_labels[row_idx], col_idx + 1, wells[well_idx], meas, value)
+                    if writer is not None:
+                        writer.writerow(row)
+                    if builder is not None:
+                        builder.append(row)
+
+        if builder is not None:
+            columnar.write_table(out_paths['npz'], builder.columns())
     except Exception as e:
         logger.error('Błąd podczas zapisywania pliku %s: %s', out_path, e)
         return ''
 
-    logger.info('Zapisano dane do: %s', out_path)
+    for path in out_paths.values():
+        logger.info('Zapisano dane do: %s', path)
     print(f'✅ Wygenerowano dane z {os.path.basename(input_file)} → {out_path}')
     return out_path
 
 
-def generate_all_from_assignment(path: str = ASSIGNMENT_FILE) -> list:
+def _generate_one(pair):
+    """
+    Przetwarza jedną parę (plik_wejściowy, plik_mapujący).
+    Zwraca krotkę (ścieżka_wyjściowa, komunikat_błędu) – dokładnie jedno z pól jest niepuste.
+    Funkcja jest na poziomie modułu, aby można ją było przekazać do puli procesów.
+    """
+    infile, mapfile = pair
+    try:
+        out = generate_data(infile, mapfile)
+    except Exception as e:
+        logger.exception('Błąd podczas generowania danych dla %s: %s', infile, e)
+        return '', str(e)
+    if not out:
+        return '', 'nie wygenerowano pliku wyjściowego (szczegóły w logu)'
+    return out, ''
+
+
+def generate_all_from_assignment(path: str = ASSIGNMENT_FILE, workers: int = None, errors: dict = None,
+                                 force: bool = False) -> list:
     """
     Dla każdej pary (plik_wejściowy, plik_mapujący) wywołuje generate_data.
-    Zwraca listę ścieżek do wygenerowanych plików.
+    workers – liczba procesów roboczych; 1 oznacza przetwarzanie sekwencyjne,
+    0 – tyle procesów, ile rdzeni CPU. Domyślnie używane jest GENERATOR_WORKERS.
+    Kolejność wyników jest zawsze zgodna z kolejnością w assignment.csv.
+    Pary, których plik wejściowy, mapowanie i GENERATOR_VERSION nie zmieniły się od
+    ostatniego przebiegu (wg MANIFEST_FILE), są pomijane – chyba że force=True.
+    Jeśli podano słownik errors, zostanie uzupełniony parami {plik_wejściowy: komunikat_błędu}.
+    Zwraca listę ścieżek do wygenerowanych (lub aktualnych) plików.
     """
-    outputs = []
     assignments = load_assignments(path)
     if not assignments:
         logger.error('Brak przypisań do przetworzenia.')
-        return outputs
+        return []
+    return generate_pairs(assignments, workers, errors, force)
+
 
-    for infile, mapfile in assignments:
+def generate_pairs(assignments: list, workers: int = None, errors: dict = None, force: bool = False) -> list:
+    """
+    Przetwarza listę par (plik_wejściowy, plik_mapujący) – patrz generate_all_from_assignment.
+    Używane także przez tryb nasłuchu katalogu (watch_folder) dla pojedynczych nowych plików.
+    Po wygenerowaniu uruchamiana jest kontrola jakości płytek (plate_qc) w podkatalogach wyników.
+    """
+    outputs = []
+    manifest = {} if force else load_manifest()
+    digests = {}
+    entries = [_manifest_entry(infile, mapfile, digests) for infile, mapfile in assignments]
+    results = [None] * len(assignments)
+    stale = []
+    for idx, (infile, _) in enumerate(assignments):
+        out_paths = [output_path_for(infile, fmt) for fmt in OUTPUT_FORMATS]
+        out_path = out_paths[0]
+        if manifest.get(out_path) == entries[idx] and all(os.path.exists(p) for p in out_paths):
+            logger.info('Plik %s jest aktualny; pomijam %s', out_path, infile)
+            results[idx] = (out_path, '')
+        else:
+            stale.append(idx)
+
+    if workers is None:
+        workers = GENERATOR_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(stale)))
+
+    stale_pairs = [assignments[idx] for idx in stale]
+    if workers == 1:
+        stale_results = [_generate_one(pair) for pair in stale_pairs]
+    else:
+        logger.info('Przetwarzanie %d przypisań w %d procesach', len(stale_pairs), workers)
         try:
-            out = generate_data(infile, mapfile)
-            if out:
-                outputs.append(out)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                stale_results = list(pool.map(_generate_one, stale_pairs))
         except Exception as e:
-            logger.exception('Błąd podczas generowania danych dla %s: %s', infile, e)
+            logger.exception('Błąd puli procesów: %s', e)
+            stale_results = [('', f'błąd puli procesów: {e}')] * len(stale_pairs)
+
+    for idx, result in zip(stale, stale_results):
+        results[idx] = result
+        out = result[0]
+        if out:
+            manifest[out] = entries[idx]
+        else:
+            manifest.pop(output_path_for(assignments[idx][0], OUTPUT_FORMATS[0]), None)
+    if stale:
+        save_manifest(manifest)
+    logger.info('Przegenerowano %d z %d plików (pozostałe aktualne)', len(stale), len(assignments))
+
+    failed = {}
+    for (infile, _), (out, error) in zip(assignments, results):
+        if out:
+            outputs.append(out)
+        else:
+            failed[infile] = error
+
+    if failed:
+        logger.warning('Nie udało się przetworzyć %d z %d plików:', len(failed), len(assignments))
+        for infile, error in failed.items():
+            logger.warning('  %s: %s', infile, error)
+    if errors is not None:
+        errors.update(failed)
 
     logger.info('Łącznie wygenerowano %d plików', len(outputs))
+    if outputs:
+        # Kontrola jakości płytek (Z', CV, S/B) – tylko gdy skonfigurowano klucz 'qc'.
+        # Import dopiero tutaj: moduły analizy importują logger_setup, który konfiguruje
+        # główny logger – przy imporcie na starcie każdy komunikat generatora byłby wypisywany dwukrotnie.
+        try:
+            import plate_qc
+            plate_qc.run_qc(outputs)
+        except Exception as e:
+            logger.exception('Błąd podczas kontroli jakości płytek: %s', e)
     return outputs
 
 
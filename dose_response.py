@@ -0,0 +1,201 @@
+"""
+Batched 4-parameter logistic (4PL / Hill) fits of concentration series.
+
+Sample names are split by a regular expression with the named groups 'dose'
+and 'series' (DEFAULT_PATTERN turns '1M_CAA' into dose 1 of series 'M_CAA' and
+'2S-H_Glc' into dose 2 of 'S-H_Glc'). Every (series, measurement or ratio) of a
+timepoint is one curve:
+
+    y = bottom + (top - bottom) / (1 + (EC50 / dose) ** hill)
+
+All curves are fitted at once by Levenberg–Marquardt: points are padded into a
+(curves, points) array with zero weights, and each iteration solves the
+damped 4x4 normal equations of every curve in one batched call. The sample
+means are weighted by their N, which gives the same parameters as fitting the
+individual replicate wells. Series with only three doses cannot determine four
+parameters; they are fitted as 3PL curves with the Hill slope fixed at ±1.
+Plateaus are kept within one data range of the observed means.
+"""
+import re
+
+import numpy as np
+
+import columnar
+
+DOSE_RESPONSE_FILENAME = 'dose_response.csv'
+DEFAULT_PATTERN = r'^(?P<dose>\d+(?:[.,]\d+)?)(?P<series>.+)$'
+MIN_DOSES = 3  # distinct doses needed to fit a curve (3PL with a fixed Hill slope below FULL_MODEL_DOSES)
+FULL_MODEL_DOSES = 4
+MAX_ITERATIONS = 200
+TOLERANCE = 1e-10  # relative change of the weighted residual sum of squares
+HILL_LIMIT = 20.0
+
+
+def split_samples(samples, pattern=DEFAULT_PATTERN):
+    """
+    Parse sample names into (dose, series) with a regex having 'dose' and 'series' groups.
+    Returns (doses as float array, NaN when not matching or not positive; list of series names).
+    """
+    regex = re.compile(pattern)
+    doses = np.full(len(samples), np.nan)
+    series = [''] * len(samples)
+    for i, name in enumerate(samples):
+        match = regex.match(name)
+        if match:
+            dose = float(match.group('dose').replace(',', '.'))
+            if dose > 0:
+                doses[i] = dose
+                series[i] = match.group('series')
+    return doses, series
+
+
+def hill(log_dose, params):
+    """4PL model on log10 doses; params[..., :] = (bottom, top, log10 EC50, hill)."""
+    bottom, top, log_ec50, slope = (params[..., k, None] for k in range(4))
+    return bottom + (top - bottom) / (1.0 + 10.0 ** (slope * (log_ec50 - log_dose)))
+
+
+def _jacobian(log_dose, params):
+    """Partial derivatives of the model (curves, points, 4)."""
+    bottom, top, log_ec50, slope = (params[..., k, None] for k in range(4))
+    power = 10.0 ** (slope * (log_ec50 - log_dose))
+    s = 1.0 / (1.0 + power)
+    ds = -s * s * power * np.log(10.0)  # d s / d(slope * (log_ec50 - log_dose))
+    span = top - bottom
+    return np.stack([1.0 - s, s, span * ds * slope, span * ds * (log_ec50 - log_dose)], axis=-1)
+
+
+def fit_curves(log_dose, y, weight, fixed_hill=None):
+    """
+    Fit 4PL curves to padded (curves, points) arrays; weight 0 marks padding.
+    fixed_hill – optional bool array of curves whose Hill slope stays at ±1 (3PL).
+    Returns (params (curves, 4), weighted SSE, converged bool array).
+    """
+    n_curves = len(y)
+    w_sum = weight.sum(axis=1)
+    y_min = np.where(weight > 0, y, np.inf).min(axis=1)
+    y_max = np.where(weight > 0, y, -np.inf).max(axis=1)
+    x_mean = (weight * log_dose).sum(axis=1) / w_sum
+    y_mean = (weight * y).sum(axis=1) / w_sum
+    trend = (weight * (log_dose - x_mean[:, None]) * (y - y_mean[:, None])).sum(axis=1)
+    span = y_max - y_min
+    lower, upper = y_min - span, y_max + span
+    free = np.ones((n_curves, 4))
+    if fixed_hill is not None:
+        free[fixed_hill, 3] = 0.0
+
+    # Start: plateaus at the extreme means, EC50 in the middle of the doses, slope ±1 following the trend
+    params = np.stack([
+        np.where(trend >= 0, y_min, y_max), np.where(trend >= 0, y_max, y_min),
+        x_mean, np.ones(n_curves),
+    ], axis=1)
+
+    current = (weight * (y - hill(log_dose, params)) ** 2).sum(axis=1)
+    damping = np.full(n_curves, 1e-3)
+    converged = np.zeros(n_curves, dtype=bool)
+    eye = np.eye(4)
+    for _ in range(MAX_ITERATIONS):
+        active = ~converged
+        if not active.any():
+            break
+        j = _jacobian(log_dose[active], params[active])
+        r = y[active] - hill(log_dose[active], params[active])
+        jw = j * weight[active, :, None]
+        a = np.einsum('cpi,cpj->cij', jw, j)
+        g = np.einsum('cpi,cp->ci', jw, r)
+        diagonal = np.einsum('cii->ci', a)
+        damped = a + (damping[active, None] * (diagonal + 1e-12))[:, :, None] * eye
+        # Fixed parameters: identity rows/columns and no gradient, so their step is 0
+        mask = free[active]
+        damped = damped * mask[:, :, None] * mask[:, None, :] + (1.0 - mask)[:, :, None] * eye
+        step = np.einsum('cij,cj->ci', np.linalg.pinv(damped), g * mask)
+
+        trial = params[active] + step
+        trial[:, 0] = np.clip(trial[:, 0], lower[active], upper[active])
+        trial[:, 1] = np.clip(trial[:, 1], lower[active], upper[active])
+        trial[:, 3] = np.clip(trial[:, 3], -HILL_LIMIT, HILL_LIMIT)
+        with np.errstate(over='ignore', invalid='ignore'):
+            trial_sse = (weight[active] * (y[active] - hill(log_dose[active], trial)) ** 2).sum(axis=1)
+        better = np.isfinite(trial_sse) & (trial_sse <= current[active])
+
+        index = np.flatnonzero(active)
+        improved = index[better]
+        change = current[improved] - trial_sse[better]
+        params[improved] = trial[better]
+        converged[improved] = change <= TOLERANCE * np.maximum(current[improved], 1e-300)
+        current[improved] = trial_sse[better]
+        damping[improved] /= 10.0
+        rejected = index[~better]
+        damping[rejected] *= 10.0
+        converged[rejected[damping[rejected] > 1e12]] = True
+
+    # Equivalent parametrization with Bottom <= Top: the sign of the Hill slope gives the direction
+    swap = params[:, 0] > params[:, 1]
+    params[swap] = params[swap][:, [1, 0, 2, 3]] * [1, 1, 1, -1]
+    return params, current, converged
+
+
+def fit_columns(summary, pattern=DEFAULT_PATTERN):
+    """
+    Fit every (series, Measurement, Denominator) of summary columns (Subdir, Sample,
+    Measurement, Denominator, N, Mean). Returns {column name: column} with one row per curve,
+    or None when no series has MIN_DOSES doses.
+    """
+    samples = list(summary['Sample'])
+    doses, series = split_samples(samples, pattern)
+    usable = np.flatnonzero(~np.isnan(doses) & np.isfinite(np.asarray(summary['Mean'], dtype=np.float64)))
+    keys = [(series[i], summary['Measurement'][i], summary['Denominator'][i]) for i in usable.tolist()]
+    curve, curve_keys = columnar.factorize(keys)
+    if not curve_keys:
+        return None
+
+    log_dose = np.log10(doses[usable])
+    distinct = np.unique(np.stack([curve.astype(np.float64), log_dose]), axis=1)
+    n_doses = np.bincount(distinct[0].astype(np.intp), minlength=len(curve_keys))
+    fitted = np.flatnonzero(n_doses >= MIN_DOSES)
+    if not fitted.size:
+        return None
+    rank = np.full(len(curve_keys), -1)
+    rank[fitted] = np.arange(len(fitted))
+    keep = rank[curve] >= 0
+    rows = rank[curve[keep]]
+    position = np.zeros(len(rows), dtype=np.intp)
+    order = np.argsort(rows, kind='stable')
+    counts = np.bincount(rows, minlength=len(fitted))
+    position[order] = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # Padded (curves, points) arrays
+    shape = (len(fitted), int(counts.max()))
+    x = np.zeros(shape)
+    y = np.zeros(shape)
+    weight = np.zeros(shape)
+    x[rows, position] = log_dose[keep]
+    y[rows, position] = np.asarray(summary['Mean'], dtype=np.float64)[usable][keep]
+    weight[rows, position] = np.asarray(summary['N'], dtype=np.float64)[usable][keep]
+
+    fixed_hill = n_doses[fitted] < FULL_MODEL_DOSES
+    params, sse, converged = fit_curves(x, y, weight, fixed_hill)
+    w_sum = weight.sum(axis=1)
+    y_mean = (weight * y).sum(axis=1) / w_sum
+    ss_total = (weight * (y - y_mean[:, None]) ** 2).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r2 = 1.0 - sse / ss_total
+        rmse = np.sqrt(sse / w_sum)
+
+    subdir = summary['Subdir'][0] if len(summary['Subdir']) else ''
+    names = [curve_keys[c] for c in fitted.tolist()]
+    return {
+        'Subdir': [subdir] * len(fitted),
+        'Series': [name for name, _, _ in names],
+        'Measurement': [measurement for _, measurement, _ in names],
+        'Denominator': [denominator for _, _, denominator in names],
+        'N_Doses': n_doses[fitted].astype(np.int64),
+        'Model': ['3PL' if fixed else '4PL' for fixed in fixed_hill.tolist()],
+        'Bottom': params[:, 0],
+        'Top': params[:, 1],
+        'EC50': 10.0 ** params[:, 2],
+        'Hill': params[:, 3],
+        'R2': r2,
+        'RMSE': rmse,
+        'Converged': ['yes' if c else 'no' for c in converged.tolist()],
+    }
@@ -0,0 +1,53 @@
+"""
+Vectorized grouped statistics for the analyser.
+
+Rows are assigned integer group codes (see columnar.factorize) and all groups
+are aggregated at once with NumPy: counts and sums via bincount, min/max via
+reduceat over the rows sorted by group. The standard deviation is the sample
+one (ddof=1) computed in two passes, like statistics.stdev; a single-value
+group gets Std = 0.0, as in the original per-group loops.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# Per-group arrays, indexed by group code.
+GroupStats = namedtuple('GroupStats', ['count', 'mean', 'std', 'sem', 'min', 'max'])
+
+
+def grouped_stats(codes, values, n_groups=None):
+    """
+    Compute count, mean, std, SEM, min and max of values for every group code.
+    codes – int array (0..n_groups-1) of the same length as values.
+    Groups without values get count 0 and NaN statistics.
+    """
+    codes = np.asarray(codes, dtype=np.intp)
+    values = np.asarray(values, dtype=np.float64)
+    if n_groups is None:
+        n_groups = int(codes.max()) + 1 if codes.size else 0
+
+    count = np.bincount(codes, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / count
+        deviations = values - mean[codes]
+        # Correct the rounding error of the running sum, so means match statistics.mean
+        mean += np.bincount(codes, weights=deviations, minlength=n_groups) / count
+        deviations = values - mean[codes]
+        sq_sum = np.bincount(codes, weights=deviations * deviations, minlength=n_groups)
+        std = np.sqrt(sq_sum / (count - 1))
+        std[count == 1] = 0.0
+        sem = std / np.sqrt(count)
+
+    minimum = np.full(n_groups, np.nan)
+    maximum = np.full(n_groups, np.nan)
+    if codes.size:
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        sorted_values = values[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        present = sorted_codes[starts]
+        minimum[present] = np.minimum.reduceat(sorted_values, starts)
+        maximum[present] = np.maximum.reduceat(sorted_values, starts)
+
+    return GroupStats(count, mean, std, sem, minimum, maximum)
+
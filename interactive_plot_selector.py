@@ -33,8 +33,9 @@ class PlotSelector:
         print(f"Znalezione podkatalogi w '{DATA_DIR}': {self.subdirs}")
 
         # Struktury do przechowywania DataFrame'ów
-        self.data_dfs = {}   # {subdir: DataFrame z data_merged.csv}
-        self.ratio_dfs = {}  # {subdir: DataFrame z ratios.csv}
+        self.data_dfs = {}   # {subdir: DataFrame z summary.csv (pomiary) lub data_merged.csv}
+        self.ratio_dfs = {}  # {subdir: DataFrame z summary.csv (ratio) lub ratios.csv}
+        self.significance_dfs = {}  # {subdir: DataFrame z significance.csv (testy Welcha)}
 
         # Lista próbek (z pierwszego odpowiedniego pliku)
         self.sample_list = []
@@ -50,6 +51,10 @@ class PlotSelector:
         self.measurement_types = []
         self.current_measurement = None
 
+        # Dla trybu 'ratio': pary (licznik, mianownik) i aktualnie wybrana para
+        self.ratio_pairs = []
+        self.current_ratio = None
+
         # Niestandardowe etykiety: {sample: label}
         self.custom_labels = {}
 
@@ -80,14 +85,39 @@ class PlotSelector:
 
     def _load_data_frames(self):
         """
-        Wczytuje data_merged.csv i ratios.csv z każdego podkatalogu.
+        Wczytuje summary.csv (jeden wiersz na próbkę i pomiar/ratio), a gdy go brak –
+        data_merged.csv i ratios.csv z każdego podkatalogu.
         Ustala sample_list i dostępne tryby.
         """
         print("Wczytywanie plików CSV z podkatalogów...")
         for sub in self.subdirs:
             sub_path = os.path.join(DATA_DIR, sub)
+            summary_file = os.path.join(sub_path, 'summary.csv')
             data_file = os.path.join(sub_path, 'data_merged.csv')
             ratio_file = os.path.join(sub_path, 'ratios.csv')
+            significance_file = os.path.join(sub_path, 'significance.csv')
+
+            if os.path.exists(significance_file):
+                try:
+                    self.significance_dfs[sub] = pd.read_csv(significance_file, keep_default_na=False)
+                    print(f"Wczytano '{significance_file}' dla '{sub}'")
+                except Exception as e:
+                    print(f"Błąd wczytywania '{significance_file}': {e}")
+
+            if os.path.exists(summary_file):
+                try:
+                    sdf = pd.read_csv(summary_file, keep_default_na=False)
+                    is_ratio = sdf['Denominator'] != ''
+                    if (~is_ratio).any():
+                        self.data_dfs[sub] = sdf[~is_ratio]
+                    if is_ratio.any():
+                        self.ratio_dfs[sub] = sdf[is_ratio].rename(
+                            columns={'Mean': 'Ratio_Mean', 'Std': 'Ratio_Std'}
+                        )
+                    print(f"Wczytano '{summary_file}' dla '{sub}'")
+                    continue
+                except Exception as e:
+                    print(f"Błąd wczytywania '{summary_file}': {e}")
 
             if os.path.exists(data_file):
                 try:
@@ -102,6 +132,10 @@ class PlotSelector:
             if os.path.exists(ratio_file):
                 try:
                     rdf = pd.read_csv(ratio_file)
+                    if 'Measurement' not in rdf.columns and 'Nominator_Measurement' in rdf.columns:
+                        # Para stosunku pod tymi samymi nazwami kolumn co w summary.csv
+                        rdf = rdf.assign(Measurement=rdf['Nominator_Measurement'],
+                                         Denominator=rdf['Denominator_Measurement'])
                     self.ratio_dfs[sub] = rdf
                     print(f"Wczytano '{ratio_file}' dla '{sub}'")
                 except Exception as e:
@@ -145,6 +179,7 @@ class PlotSelector:
             rdf0 = self.ratio_dfs[first_sub]
             self.sample_list = sorted(rdf0['Sample'].unique().tolist())
             print(f"Próbki (z ratios, '{first_sub}'): {self.sample_list}")
+            self._set_ratio_pairs()
 
         # Inicjalizuj etykiety, kolory i hatch dla każdej próbki
         for s in self.sample_list:
@@ -284,22 +319,14 @@ class PlotSelector:
             col += 1
 
         self.measurement_var = tk.StringVar(value=self.current_measurement or "")
+        self.measurement_label = None
         self.measurement_menu = None
         if self.mode == 'data':
-            tk.Label(mode_frame, text="Measurement:").grid(
-                row=1, column=0, padx=5, pady=2, sticky="w"
-            )
-            self.measurement_menu = ttk.Combobox(
-                mode_frame, textvariable=self.measurement_var,
-                values=self.measurement_types, state='readonly'
-            )
-            self.measurement_menu.grid(
-                row=1, column=1, columnspan=max(col-1, 1),
-                padx=5, pady=2, sticky="we"
-            )
-            self.measurement_menu.bind(
-                "<<ComboboxSelected>>", self._on_measurement_change
-            )
+            self._build_selector(mode_frame, "Measurement:", self.measurement_types,
+                                 self.current_measurement, max(col - 1, 1))
+        elif self.ratio_pairs:
+            self._build_selector(mode_frame, "Stosunek:", self._ratio_labels(),
+                                 self._ratio_label(self.current_ratio), max(col - 1, 1))
 
         list_frame = tk.LabelFrame(
             left_frame, text="Próbki (kliknij, aby zaznaczyć/odznaczyć)"
@@ -472,35 +499,26 @@ class PlotSelector:
             self.current_measurement = (
                 self.measurement_types[0] if self.measurement_types else None
             )
-            if self.measurement_menu is None:
-                mode_frame = self.root.children['!frame'].children['!labelframe']
-                tk.Label(
-                    mode_frame, text="Measurement:"
-                ).grid(row=1, column=0, padx=5, pady=2, sticky="w")
-                self.measurement_menu = ttk.Combobox(
-                    mode_frame, textvariable=self.measurement_var,
-                    values=self.measurement_types, state='readonly'
-                )
-                self.measurement_menu.grid(
-                    row=1, column=1, columnspan=1,
-                    padx=5, pady=2, sticky="we"
-                )
-                self.measurement_menu.bind(
-                    "<<ComboboxSelected>>", self._on_measurement_change
-                )
-            else:
-                self.measurement_menu.config(
-                    values=self.measurement_types, state='readonly'
-                )
-                self.measurement_menu.set(self.current_measurement)
+            if self.measurement_menu is not None:
+                self.measurement_label.destroy()
+                self.measurement_menu.destroy()
+            mode_frame = self.root.children['!frame'].children['!labelframe']
+            self._build_selector(mode_frame, "Measurement:", self.measurement_types,
+                                 self.current_measurement, 1)
         else:
             first_sub = next(iter(self.ratio_dfs))
             rdf0 = self.ratio_dfs[first_sub]
             self.sample_list = sorted(rdf0['Sample'].unique().tolist())
             print(f"[Mode change] Próbki w 'ratio': {self.sample_list}")
-            if self.measurement_menu:
+            self._set_ratio_pairs()
+            if self.measurement_menu is not None:
+                self.measurement_label.destroy()
                 self.measurement_menu.destroy()
                 self.measurement_menu = None
+            if self.ratio_pairs:
+                mode_frame = self.root.children['!frame'].children['!labelframe']
+                self._build_selector(mode_frame, "Stosunek:", self._ratio_labels(),
+                                     self._ratio_label(self.current_ratio), 1)
 
         for sub, lb in self.listboxes.items():
             print(f"[Mode change] Aktualizuję listę '{sub}'")
@@ -520,12 +538,84 @@ class PlotSelector:
 
         self._update_plot()
 
+    def _build_selector(self, mode_frame, text, values, current, columnspan):
+        """
+        Tworzy etykietę i listę rozwijaną wyboru pomiaru (tryb 'data')
+        lub pary stosunku (tryb 'ratio').
+        """
+        self.measurement_label = tk.Label(mode_frame, text=text)
+        self.measurement_label.grid(row=1, column=0, padx=5, pady=2, sticky="w")
+        self.measurement_menu = ttk.Combobox(
+            mode_frame, textvariable=self.measurement_var,
+            values=values, state='readonly'
+        )
+        self.measurement_menu.grid(
+            row=1, column=1, columnspan=columnspan,
+            padx=5, pady=2, sticky="we"
+        )
+        self.measurement_menu.bind(
+            "<<ComboboxSelected>>", self._on_measurement_change
+        )
+        self.measurement_menu.set(current or "")
+
+    def _set_ratio_pairs(self):
+        """
+        Zbiera pary (licznik, mianownik) ze wszystkich tabel ratio i ustawia pierwszą jako aktualną.
+        Tabele bez kolumn Measurement/Denominator nie wnoszą par.
+        """
+        pairs = set()
+        for rdf in self.ratio_dfs.values():
+            if {'Measurement', 'Denominator'} <= set(rdf.columns):
+                pairs.update(zip(rdf['Measurement'], rdf['Denominator']))
+        self.ratio_pairs = sorted(pairs)
+        if self.current_ratio not in self.ratio_pairs:
+            self.current_ratio = self.ratio_pairs[0] if self.ratio_pairs else None
+        print(f"Pary stosunków: {self.ratio_pairs}, aktualna: {self.current_ratio}")
+
+    @staticmethod
+    def _ratio_label(pair):
+        return f"{pair[0]} / {pair[1]}" if pair else ""
+
+    def _ratio_labels(self):
+        return [self._ratio_label(pair) for pair in self.ratio_pairs]
+
+    def _ratio_stats(self, rdf, sample):
+        """
+        Zwraca (Ratio_Mean, Ratio_Std) próbki dla aktualnej pary stosunku albo None, gdy brak danych.
+        Zgłasza ValueError, gdy wybór jest niejednoznaczny (kilka różnych wyników dla próbki).
+        """
+        if rdf is None:
+            return None
+        rows = rdf[rdf['Sample'] == sample]
+        if self.current_ratio is not None and {'Measurement', 'Denominator'} <= set(rows.columns):
+            numerator, denominator = self.current_ratio
+            rows = rows[(rows['Measurement'] == numerator) & (rows['Denominator'] == denominator)]
+        if rows.empty:
+            return None
+        # ratios.csv ma wiele wierszy (studzienek) na próbkę, ale te same Ratio_Mean/Ratio_Std
+        stats = rows[['Ratio_Mean', 'Ratio_Std']].drop_duplicates()
+        if len(stats) > 1:
+            raise ValueError(
+                f"Niejednoznaczny stosunek dla próbki '{sample}': {len(stats)} różnych wyników "
+                f"(para {self._ratio_label(self.current_ratio) or 'nieokreślona'})."
+            )
+        return stats.iloc[0]['Ratio_Mean'], stats.iloc[0]['Ratio_Std']
+
     def _on_measurement_change(self, event):
-        new_measurement = self.measurement_var.get()
-        print(f"Zmieniono Measurement na: {new_measurement}")
-        if new_measurement == self.current_measurement:
+        selected = self.measurement_var.get()
+        if self.mode == 'ratio':
+            labels = self._ratio_labels()
+            pair = self.ratio_pairs[labels.index(selected)] if selected in labels else None
+            print(f"Zmieniono parę stosunku na: {selected}")
+            if pair is None or pair == self.current_ratio:
+                return
+            self.current_ratio = pair
+            self._update_plot()
+            return
+        print(f"Zmieniono Measurement na: {selected}")
+        if selected == self.current_measurement:
             return
-        self.current_measurement = new_measurement
+        self.current_measurement = selected
         self._update_plot()
 
     def _on_listbox_click(self, event, subdir):
@@ -744,11 +834,16 @@ class PlotSelector:
                         means.append(0)
                         stds.append(0)
                 else:
-                    rdf = self.ratio_dfs.get(sub)
-                    df_s = rdf[rdf['Sample'] == s]
-                    if not df_s.empty:
-                        means.append(df_s['Ratio_Mean'].values[0])
-                        stds.append(df_s['Ratio_Std'].values[0])
+                    try:
+                        stats = self._ratio_stats(self.ratio_dfs.get(sub), s)
+                    except ValueError as e:
+                        messagebox.showerror("Błąd", str(e))
+                        self.ax.set_title("Niejednoznaczny wybór stosunku")
+                        self.canvas.draw()
+                        return
+                    if stats is not None:
+                        means.append(stats[0])
+                        stds.append(stats[1])
                     else:
                         means.append(0)
                         stds.append(0)
@@ -783,6 +878,8 @@ class PlotSelector:
                 edgecolor=bar_hatch_colors,
             )
 
+            self._draw_significance(sub, selected_in_sub, xs, means, stds)
+
             for i, s in enumerate(selected_in_sub):
                 x_ticks.append(xs[i])
                 x_labels.append(self.custom_labels.get(s, s))
@@ -808,6 +905,41 @@ class PlotSelector:
 
         self.canvas.draw()
 
+    def _draw_significance(self, sub, samples, xs, means, stds):
+        """
+        Rysuje nad słupkami nawiasy z oznaczeniami (*, **, ***) dla par zaznaczonych próbek,
+        które według significance.csv różnią się istotnie (P_Adjusted).
+        """
+        sdf = self.significance_dfs.get(sub)
+        if sdf is None or len(samples) < 2:
+            return
+        if self.mode == 'data':
+            rows = sdf[(sdf['Measurement'] == self.current_measurement) & (sdf['Denominator'] == '')]
+        else:
+            if self.current_ratio is None:
+                return
+            numerator, denominator = self.current_ratio
+            rows = sdf[(sdf['Measurement'] == numerator) & (sdf['Denominator'] == denominator)]
+        rows = rows[(rows['Test'] == 'Welch t') & ~rows['Significance'].isin(['', 'ns'])]
+        if rows.empty:
+            return
+
+        position = {s: i for i, s in enumerate(samples)}
+        tops = [m + (sd if pd.notna(sd) else 0) for m, sd in zip(means, stds)]
+        step = 0.05 * (max(abs(t) for t in tops) or 1)
+        level = max(tops) + step
+        for _, row in rows.iterrows():
+            a = position.get(row['Sample_A'])
+            b = position.get(row['Sample_B'])
+            if a is None or b is None:
+                continue
+            x1, x2 = xs[a], xs[b]
+            self.ax.plot([x1, x1, x2, x2], [level, level + step / 2, level + step / 2, level],
+                         color='black', linewidth=1)
+            self.ax.text((x1 + x2) / 2, level + step / 2, row['Significance'],
+                         ha='center', va='bottom', fontsize=self.label_font_size)
+            level += 2 * step
+
     def run(self):
         print("Uruchamiam pętlę główną tkinter...")
         self.root.mainloop()
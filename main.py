@@ -6,6 +6,7 @@ import mappings_assigner
 import data_generator
 import data_analyser
 import interactive_plot_selector
+import watch_folder
 
 ROOT_DIR = os.getcwd()
 INPUT_DIR = 'input'
@@ -33,6 +34,7 @@ def main_menu():
         print('3 - Generuj dane')
         print('4 - Analiza danych')
         print('5 - Interaktywny wykres')
+        print('6 - Nasłuch katalogu input (automatyczne przetwarzanie)')
         print('0 - Zakończ')
         choice = input('> ')
         if choice == '1':
@@ -57,6 +59,8 @@ def main_menu():
         elif choice == '5':
             app = interactive_plot_selector.PlotSelector()
             app.run()
+        elif choice == '6':
+            watch_folder.watch()
         elif choice == '0':
             break
         else:
@@ -0,0 +1,265 @@
+"""
+Compact in-memory table of measurements used by the analyser.
+
+Every column except Value is dictionary-encoded (int32 codes plus a list of
+category strings, see columnar.Categorical) and Value is a float64 array, so
+a well costs a few dozen bytes instead of a dict of strings. Tables are never
+modified in place: selecting rows builds new code arrays that share the
+categories of the source table.
+
+Extra float columns (e.g. Raw_Value) are stored as plain float64 arrays,
+like Value; take() and concat() handle them next to the string columns.
+"""
+import csv
+
+import numpy as np
+
+import columnar
+from logger_setup import logger
+
+VALUE_COLUMN = 'Value'
+# Original values kept next to Value after normalization (see with_values)
+RAW_VALUE_COLUMN = 'Raw_Value'
+
+
+class MeasurementTable:
+    """
+    Columnar table: fieldnames (in file order, including 'Value'),
+    columns {name: Categorical} for every string column ({name: float64 array}
+    for extra float columns such as Raw_Value) and value (float64 array).
+    """
+
+    __slots__ = ('fieldnames', 'columns', 'value')
+
+    def __init__(self, fieldnames, columns, value):
+        self.fieldnames = list(fieldnames)
+        self.columns = columns
+        self.value = value
+
+    def __len__(self):
+        return len(self.value)
+
+    def codes(self, name):
+        """Return the int32 code array of a string column."""
+        return self.columns[name].codes
+
+    def categories(self, name):
+        """Return the list of distinct strings of a column (indexed by its codes)."""
+        return self.columns[name].categories
+
+    def strings(self, name):
+        """Return a column decoded to an object array of strings (Value as Python float reprs)."""
+        if name == VALUE_COLUMN:
+            return np.array([repr(v) for v in self.value.tolist()], dtype=object)
+        return columnar.to_strings(self.columns[name])
+
+    def take(self, index):
+        """Return a new table with the rows selected by an index array or boolean mask."""
+        columns = {
+            name: column[index] if isinstance(column, np.ndarray)
+            else columnar.Categorical(column.codes[index], column.categories)
+            for name, column in self.columns.items()
+        }
+        return MeasurementTable(self.fieldnames, columns, self.value[index])
+
+    def with_values(self, value):
+        """
+        Return a table with Value replaced by value (same rows); the original values
+        are kept in Raw_Value unless the table already has that column.
+        """
+        fieldnames = list(self.fieldnames)
+        columns = dict(self.columns)
+        if RAW_VALUE_COLUMN not in columns:
+            fieldnames.insert(fieldnames.index(VALUE_COLUMN) + 1, RAW_VALUE_COLUMN)
+            columns[RAW_VALUE_COLUMN] = self.value
+        return MeasurementTable(fieldnames, columns, value)
+
+    def group_index(self, *names):
+        """
+        Combine one or more string columns into a single integer group code per row
+        (mixed-radix of the column codes, compacted with np.unique).
+        Returns (codes, combined_keys) where combined_keys[code] is the mixed-radix key.
+        """
+        combined = np.zeros(len(self), dtype=np.int64)
+        for name in names:
+            column = self.columns[name]
+            combined = combined * max(len(column.categories), 1) + column.codes
+        uniq, codes = np.unique(combined, return_inverse=True)
+        return codes.reshape(-1).astype(np.int32), uniq
+
+    def group_codes(self, *names):
+        """
+        Combine one or more string columns into a single group code per row.
+        Returns (codes, keys) where keys[code] is the tuple of strings of that group
+        (or the string itself for a single column).
+        """
+        codes, uniq = self.group_index(*names)
+
+        keys = []
+        for key in uniq.tolist():
+            parts = []
+            for name in reversed(names):
+                categories = self.columns[name].categories
+                key, code = divmod(key, max(len(categories), 1))
+                parts.append(categories[code])
+            parts.reverse()
+            keys.append(parts[0] if len(names) == 1 else tuple(parts))
+        return codes, keys
+
+    def pivot(self, index_columns, column='Measurement'):
+        """
+        Align Value into a matrix with one row per distinct key of index_columns
+        (in order of first appearance) and one column per category of column.
+        Returns (first_rows, values, present): first_rows[k] is the first table row
+        of key k, values is float64 (NaN where absent) and present marks filled cells.
+        When a key has the same category more than once, the last row wins.
+        """
+        key_codes, uniq = self.group_index(*index_columns)
+        n_keys = len(uniq)
+        _, first_rows = np.unique(key_codes, return_index=True)
+        order = np.argsort(first_rows, kind='stable')
+        rank = np.empty(n_keys, dtype=np.intp)
+        rank[order] = np.arange(n_keys)
+
+        rows = rank[key_codes]
+        categories = self.codes(column)
+        shape = (n_keys, len(self.categories(column)))
+        values = np.full(shape, np.nan)
+        present = np.zeros(shape, dtype=bool)
+        values[rows, categories] = self.value
+        present[rows, categories] = True
+        return first_rows[order], values, present
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Concatenate tables, merging the categories of each column.
+        Columns missing from some tables are filled with empty strings (NaN for float columns).
+        """
+        tables = list(tables)
+        fieldnames = []
+        for table in tables:
+            fieldnames.extend(n for n in table.fieldnames if n not in fieldnames)
+
+        columns = {}
+        for name in fieldnames:
+            if name == VALUE_COLUMN:
+                continue
+            if any(isinstance(t.columns.get(name), np.ndarray) for t in tables):
+                columns[name] = np.concatenate([
+                    t.columns.get(name, np.full(len(t), np.nan)) for t in tables
+                ])
+                continue
+            index = {}
+            parts = []
+            for table in tables:
+                column = table.columns.get(name)
+                if column is None:
+                    column = columnar.Categorical(np.zeros(len(table), dtype=np.int32), [''])
+                remap = np.array(
+                    [index.setdefault(c, len(index)) for c in column.categories], dtype=np.int32
+                )
+                parts.append(remap[column.codes] if len(remap) else column.codes)
+            codes = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+            columns[name] = columnar.Categorical(codes, list(index))
+
+        value = np.concatenate([t.value for t in tables]) if tables else np.zeros(0)
+        return cls(fieldnames, columns, value)
+
+
+def _categorical(values):
+    """Dictionary-encode a column read from a file; numeric columns become their string form."""
+    if isinstance(values, columnar.Categorical):
+        return values
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        uniq, codes = np.unique(values, return_inverse=True)
+        return columnar.Categorical(codes.astype(np.int32), [str(v) for v in uniq.tolist()])
+    codes, categories = columnar.factorize(values.tolist())
+    return columnar.Categorical(codes, [str(c) for c in categories])
+
+
+def _parse_values(raw, path, sample_strings, measurement_strings):
+    """
+    Convert the Value column to float64. Returns (values, keep_mask);
+    rows with invalid values are logged and masked out.
+    """
+    try:
+        return np.asarray(raw, dtype=np.float64), None
+    except ValueError:
+        pass
+    values = np.empty(len(raw), dtype=np.float64)
+    keep = np.ones(len(raw), dtype=bool)
+    for i, v in enumerate(raw):
+        try:
+            values[i] = float(v)
+        except ValueError:
+            keep[i] = False
+            logger.warning(
+                "Nieprawidłowa wartość w kolumnie 'Value' w %s (Sample=%s, Measurement=%s); pomijam wiersz.",
+                path, sample_strings[i] if sample_strings else '',
+                measurement_strings[i] if measurement_strings else ''
+            )
+    return values, keep
+
+
+def _build_table(path, fieldnames, raw_columns):
+    """Build a MeasurementTable from {name: column} read from a file."""
+    if VALUE_COLUMN not in raw_columns:
+        columns = {n: _categorical(c) for n, c in raw_columns.items()}
+        n_rows = len(next(iter(columns.values())).codes) if columns else 0
+        return MeasurementTable(fieldnames, columns, np.full(n_rows, np.nan))
+
+    raw_value = raw_columns[VALUE_COLUMN]
+    if isinstance(raw_value, np.ndarray) and raw_value.dtype.kind == 'f':
+        values, keep = raw_value.astype(np.float64), None
+    else:
+        values, keep = _parse_values(
+            raw_value, path, raw_columns.get('Sample'), raw_columns.get('Measurement')
+        )
+    columns = {n: _categorical(c) for n, c in raw_columns.items() if n != VALUE_COLUMN}
+    table = MeasurementTable(fieldnames, columns, values)
+    return table if keep is None else table.take(keep)
+
+
+def read_csv_table(path):
+    """Read a CSV file (header + rows) into a MeasurementTable."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        fieldnames = next(reader, [])
+        rows = [row for row in reader if row]
+    width = len(fieldnames)
+    columns = [list(col) for col in zip(*(row[:width] + [''] * (width - len(row)) for row in rows))]
+    if not columns:
+        columns = [[] for _ in fieldnames]
+    return _build_table(path, fieldnames, dict(zip(fieldnames, columns)))
+
+
+def read_npz_table(path):
+    """Read a columnar *_data.npz file into a MeasurementTable without decoding strings."""
+    table = columnar.read_table(path)
+    return _build_table(path, list(table), table)
+
+
+def read_unique(path, name):
+    """Return the set of distinct strings of one column of a *_data.csv or *_data.npz file."""
+    if path.lower().endswith('.npz'):
+        with np.load(path, allow_pickle=False) as data:
+            if name + columnar.CODES_SUFFIX in data.files:
+                categories = data[name + columnar.CATEGORIES_SUFFIX].tolist()
+                return {categories[c] for c in np.unique(data[name + columnar.CODES_SUFFIX]).tolist()}
+            return {str(v) for v in np.unique(data[name]).tolist()}
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if name not in header:
+            return set()
+        idx = header.index(name)
+        return {row[idx] for row in reader if len(row) > idx}
+
+
+def read_table(path):
+    """Read a *_data.csv or *_data.npz file into a MeasurementTable."""
+    if path.lower().endswith('.npz'):
+        return read_npz_table(path)
+    return read_csv_table(path)
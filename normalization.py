@@ -0,0 +1,75 @@
+"""
+Per-plate background subtraction and reference normalization.
+
+Rules come from the 'normalization' key of the analysis configuration and are
+applied in order to every plate table before statistics and ratios:
+
+    {"control": "CAA_Spc", "apply_to": "*_CAA", "operation": "subtract"}
+
+control and apply_to are fnmatch patterns matched against Sample; the control
+value is the mean of the control wells of the same (Plate, Measurement). All
+groups of a table are handled at once: control means come from one bincount
+over the (Plate, Measurement) group codes and are spread back onto the rows.
+A rule sees the values left by the previous rules, so a blank subtraction can
+precede a division by a reference. Wells whose plate has no control wells for
+their measurement (or, when dividing, a zero control mean) are dropped.
+The original values are kept in the Raw_Value column.
+"""
+from fnmatch import fnmatchcase
+
+import numpy as np
+
+from logger_setup import logger
+
+GROUP_COLUMNS = ('Plate', 'Measurement')
+
+
+def sample_mask(table, pattern):
+    """Boolean mask of rows whose Sample matches an fnmatch pattern (matched once per category)."""
+    hits = np.array([fnmatchcase(c, pattern) for c in table.categories('Sample')], dtype=bool)
+    if not hits.size:
+        return np.zeros(len(table), dtype=bool)
+    return hits[table.codes('Sample')]
+
+
+def normalize_table(table, rules, source=''):
+    """
+    Apply normalization rules to one plate table (or several plates – grouping is per Plate).
+    Returns a new MeasurementTable with normalized Value and the original values in Raw_Value;
+    the table itself when there are no rules.
+    """
+    if not rules:
+        return table
+    codes, uniq = table.group_index(*GROUP_COLUMNS)
+    n_groups = len(uniq)
+    measurement_codes = table.codes('Measurement')
+    measurement_names = table.categories('Measurement')
+    value = table.value.copy()
+    keep = np.ones(len(table), dtype=bool)
+
+    for rule in rules:
+        control = sample_mask(table, rule['control'])
+        target = sample_mask(table, rule.get('apply_to', '*'))
+        if rule.get('measurements'):
+            selected = [measurement_names.index(m) for m in rule['measurements'] if m in measurement_names]
+            target &= np.isin(measurement_codes, selected)
+
+        count = np.bincount(codes[control], minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reference = (np.bincount(codes[control], weights=value[control], minlength=n_groups) / count)[codes]
+        missing = target & ~np.isfinite(reference)
+        if rule['operation'] == 'divide':
+            missing |= target & (reference == 0)
+        if missing.any():
+            logger.warning("Brak studzienek kontrolnych '%s' (lub zerowa średnia) dla %d studzienek w %s; "
+                           "pomijam je.", rule['control'], int(missing.sum()), source)
+
+        apply = target & ~missing
+        if rule['operation'] == 'subtract':
+            value[apply] -= reference[apply]
+        else:
+            value[apply] /= reference[apply]
+        keep &= ~missing
+
+    normalized = table.with_values(value)
+    return normalized if keep.all() else normalized.take(keep)
@@ -0,0 +1,163 @@
+"""
+Mergeable per-plate partial aggregates for incremental analysis.
+
+For every raw plate file (*_data.csv / *_data.npz) the analyser keeps, per
+(Sample, Measurement), the count, the sum of values, the sum of squared
+deviations from the plate mean (M2, as in Welford's algorithm) and min/max.
+They are stored in data/<subdir>/.partials/<plate>.npz together with the
+(mtime, size) signature of the source file and a variant tag (e.g. the
+normalization rules the table was prepared with), so only new or regenerated
+plates, or plates analysed with different settings, are read again. Timepoint statistics are obtained by merging the partials
+(Chan et al. pairwise update), which gives the same Mean/Std as a pass over
+all rows.
+
+The sum is kept as a pair of floats (hi, lo) whose sum carries the plate total
+to about twice double precision, so merged means round like statistics.mean.
+"""
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import group_stats
+import measurement_table
+from logger_setup import logger
+
+PARTIALS_DIR = '.partials'
+PARTIALS_VERSION = 1
+GROUP_COLUMNS = ('Sample', 'Measurement')
+
+# One entry per (Sample, Measurement) group of a plate.
+PlatePartials = namedtuple('PlatePartials', ['samples', 'measurements', 'count', 'sum_hi', 'sum_lo',
+                                             'm2', 'min', 'max'])
+
+
+def partials_path(raw_path):
+    """Path of the partials file of a raw plate file."""
+    directory, name = os.path.split(raw_path)
+    return os.path.join(directory, PARTIALS_DIR, os.path.splitext(name)[0] + '.npz')
+
+
+def _signature(path, variant=0):
+    st = os.stat(path)
+    return np.array([st.st_mtime_ns, st.st_size, PARTIALS_VERSION, variant], dtype=np.int64)
+
+
+def compute_partials(table):
+    """Compute the partial aggregates of one plate table per (Sample, Measurement)."""
+    codes, keys = table.group_codes(*GROUP_COLUMNS)
+    n_groups = len(keys)
+    stats = group_stats.grouped_stats(codes, table.value, n_groups)
+
+    # Exact per-group sums as (hi, lo): math.fsum is correctly rounded
+    sum_hi = np.zeros(n_groups)
+    sum_lo = np.zeros(n_groups)
+    if n_groups:
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(stats.count)[:-1]
+        for g, values in enumerate(np.split(table.value[order], bounds)):
+            values = values.tolist()
+            sum_hi[g] = math.fsum(values)
+            sum_lo[g] = math.fsum(values + [-sum_hi[g]])
+
+    deviations = table.value - stats.mean[codes]
+    m2 = np.bincount(codes, weights=deviations * deviations, minlength=n_groups)
+    return PlatePartials(
+        [k[0] for k in keys], [k[1] for k in keys],
+        stats.count.astype(np.int64), sum_hi, sum_lo, m2, stats.min, stats.max,
+    )
+
+
+def save_partials(raw_path, partials, variant=0):
+    """Store plate partials next to the raw file (in PARTIALS_DIR), tagged with its signature."""
+    path = partials_path(raw_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = partials._asdict()
+    arrays['samples'] = np.array(partials.samples, dtype=str)
+    arrays['measurements'] = np.array(partials.measurements, dtype=str)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, signature=_signature(raw_path, variant), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_partials(raw_path, variant=0):
+    """Return stored partials of a raw file, or None when missing, older than the file or of another variant."""
+    path = partials_path(raw_path)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if not np.array_equal(data['signature'], _signature(raw_path, variant)):
+                return None
+            return PlatePartials(
+                data['samples'].tolist(), data['measurements'].tolist(),
+                *(data[f] for f in PlatePartials._fields[2:])
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def plate_partials(raw_path, table=None, variant=0):
+    """
+    Return the partials of a raw plate file, recomputing (and storing) them only
+    when the file changed. table – already loaded MeasurementTable of the file (optional;
+    required when the table is prepared from the file in a non-default variant).
+    Returns None when the file cannot be read.
+    """
+    partials = load_partials(raw_path, variant)
+    if partials is not None:
+        return partials
+    if table is None:
+        try:
+            table = measurement_table.read_table(raw_path)
+        except Exception as e:
+            logger.error("Nie udało się wczytać %s: %s", raw_path, e)
+            return None
+    partials = compute_partials(table)
+    try:
+        save_partials(raw_path, partials, variant)
+        logger.debug("Zapisano częściowe statystyki płytki %s", raw_path)
+    except OSError as e:
+        logger.warning("Nie udało się zapisać częściowych statystyk %s: %s", raw_path, e)
+    return partials
+
+
+def merge_partials(partials_list):
+    """
+    Merge plate partials into timepoint statistics.
+    Returns (keys, GroupStats) where keys[i] is the (Sample, Measurement) tuple of group i.
+    """
+    partials_list = [p for p in partials_list if p is not None]
+    index = {}
+    codes = np.array([
+        index.setdefault(key, len(index))
+        for p in partials_list for key in zip(p.samples, p.measurements)
+    ], dtype=np.intp)
+    keys = list(index)
+    n_groups = len(keys)
+
+    def cat(field):
+        return np.concatenate([np.asarray(getattr(p, field)) for p in partials_list]) if partials_list \
+            else np.zeros(0)
+
+    count_parts = cat('count').astype(np.float64)
+    count = np.bincount(codes, weights=count_parts, minlength=n_groups)
+
+    # Exact merged sums: fsum over the (hi, lo) pairs of every plate of the group
+    terms = [[] for _ in range(n_groups)]
+    for code, hi, lo in zip(codes.tolist(), cat('sum_hi').tolist(), cat('sum_lo').tolist()):
+        terms[code].extend((hi, lo))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.array([math.fsum(t) for t in terms]) / count
+        plate_mean = (cat('sum_hi') + cat('sum_lo')) / count_parts
+        shift = plate_mean - mean[codes]
+        m2 = np.bincount(codes, weights=cat('m2') + count_parts * shift * shift, minlength=n_groups)
+        std = np.sqrt(m2 / (count - 1))
+        std[count == 1] = 0.0
+        sem = std / np.sqrt(count)
+
+    minimum = np.full(n_groups, np.inf)
+    maximum = np.full(n_groups, -np.inf)
+    np.minimum.at(minimum, codes, cat('min'))
+    np.maximum.at(maximum, codes, cat('max'))
+    return keys, group_stats.GroupStats(count.astype(np.int64), mean, std, sem, minimum, maximum)
@@ -0,0 +1,61 @@
+"""
+Geometria płytek mikrotitracyjnych (96, 384 i 1536 dołków).
+
+Studzienki numerowane są wierszami: indeks = row_index * columns + column_index - 1.
+Wiersze płytek 1536-dołkowych po 'Z' mają etykiety dwuliterowe ('AA'–'AF').
+"""
+import string
+from collections import namedtuple
+
+# rows – krotka etykiet wierszy, columns – liczba kolumn
+PlateGeometry = namedtuple('PlateGeometry', ['rows', 'columns'])
+
+# Format płytki (liczba dołków) -> (liczba wierszy, liczba kolumn)
+PLATE_FORMATS = {
+    96: (8, 12),
+    384: (16, 24),
+    1536: (32, 48),
+}
+DEFAULT_FORMAT = 96
+
+
+def row_labels(count: int) -> tuple:
+    """Zwraca etykiety kolejnych wierszy: A, B, ..., Z, AA, AB, ..."""
+    letters = string.ascii_uppercase
+    labels = list(letters[:count])
+    for first in letters:
+        for second in letters:
+            if len(labels) >= count:
+                return tuple(labels)
+            labels.append(first + second)
+    return tuple(labels[:count])
+
+
+def geometry_for_format(wells: int) -> PlateGeometry:
+    """Zwraca geometrię dla formatu płytki (96, 384 lub 1536); None dla nieznanego formatu."""
+    shape = PLATE_FORMATS.get(wells)
+    if shape is None:
+        return None
+    n_rows, n_columns = shape
+    return PlateGeometry(row_labels(n_rows), n_columns)
+
+
+def geometry_for_columns(n_columns: int) -> PlateGeometry:
+    """Rozpoznaje geometrię po liczbie kolumn w nagłówku bloku (12, 24 lub 48); None gdy nieznana."""
+    for wells, (_, columns) in PLATE_FORMATS.items():
+        if columns == n_columns:
+            return geometry_for_format(wells)
+    return None
+
+
+def well_count(geometry: PlateGeometry) -> int:
+    """Liczba studzienek płytki."""
+    return len(geometry.rows) * geometry.columns
+
+
+def well_names(geometry: PlateGeometry) -> list:
+    """Nazwy wszystkich studzienek w kolejności indeksów: ['A01', 'A02', ..., 'H12']."""
+    return [f'{row}{col:02d}' for row in geometry.rows for col in range(1, geometry.columns + 1)]
+
+
+DEFAULT_GEOMETRY = geometry_for_format(DEFAULT_FORMAT)
@@ -0,0 +1,167 @@
+"""
+Plate quality control from designated control wells.
+
+After data_generator writes the plate files of a subdirectory, all its plates
+are read into one table and, for every (Plate, Measurement), the positive and
+negative control wells (Sample matching fnmatch patterns from the 'qc' key of
+the analysis configuration) are aggregated in one pass with bincount:
+
+- CV of each control (100 * SD / |mean|),
+- signal-to-background S/B = mean(positive) / mean(negative),
+- Z'-factor = 1 - 3 * (SD(positive) + SD(negative)) / |mean(positive) - mean(negative)|
+  (Zhang et al. 1999; > 0.5 is an excellent assay window).
+
+The table is written to data/<subdir>/plate_qc.csv. A plate passes when every
+measurement has Z' >= min_z_prime and both CVs <= max_cv (when set); plates
+with fewer than two wells of a control get 'n/a'. With "exclude": true the
+analyser leaves out plates that failed.
+"""
+import csv
+import os
+
+import numpy as np
+
+import analysis_config
+import normalization
+from logger_setup import logger
+from measurement_table import MeasurementTable, read_table
+
+QC_FILENAME = 'plate_qc.csv'
+NOT_DETERMINED = 'n/a'  # QC_Pass when a control has fewer than two wells on the plate
+QC_COLUMNS = ['Plate', 'File', 'Measurement', 'N_Pos', 'Mean_Pos', 'SD_Pos', 'CV_Pos', 'N_Neg', 'Mean_Neg',
+              'SD_Neg', 'CV_Neg', 'S_B', 'Z_Prime', 'QC_Pass']
+
+
+def _control_stats(codes, mask, value, n_groups):
+    """Count, mean and sample SD of the masked rows per group code (NaN when fewer than 2 wells)."""
+    count = np.bincount(codes[mask], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes[mask], weights=value[mask], minlength=n_groups) / count
+        deviations = value[mask] - mean[codes[mask]]
+        sd = np.sqrt(np.bincount(codes[mask], weights=deviations * deviations, minlength=n_groups) / (count - 1))
+    sd[count < 2] = np.nan
+    return count, mean, sd
+
+
+def qc_columns(table, files, settings):
+    """
+    QC metrics of every (Plate, Measurement) of a table. files – per-row source file names.
+    Returns {column name: list or array} ordered like QC_COLUMNS.
+    """
+    codes, _ = table.group_index('Plate', 'Measurement')
+    n_groups = int(codes.max()) + 1 if len(codes) else 0
+    first = np.unique(codes, return_index=True)[1]
+
+    n_pos, mean_pos, sd_pos = _control_stats(codes, normalization.sample_mask(table, settings['positive']),
+                                             table.value, n_groups)
+    n_neg, mean_neg, sd_neg = _control_stats(codes, normalization.sample_mask(table, settings['negative']),
+                                             table.value, n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cv_pos = 100.0 * sd_pos / np.abs(mean_pos)
+        cv_neg = 100.0 * sd_neg / np.abs(mean_neg)
+        s_b = mean_pos / mean_neg
+        z_prime = 1.0 - 3.0 * (sd_pos + sd_neg) / np.abs(mean_pos - mean_neg)
+
+    passed = z_prime >= settings.get('min_z_prime', 0.5)
+    undetermined = np.isnan(z_prime)
+    max_cv = settings.get('max_cv')
+    if max_cv is not None:
+        passed &= (cv_pos <= max_cv) & (cv_neg <= max_cv)
+        undetermined |= np.isnan(cv_pos) | np.isnan(cv_neg)
+    status = np.where(undetermined, NOT_DETERMINED, np.where(passed, 'yes', 'no'))
+
+    plates = table.strings('Plate')[first]
+    measurements = table.strings('Measurement')[first]
+    return {
+        'Plate': list(plates), 'File': [files[i] for i in first.tolist()], 'Measurement': list(measurements),
+        'N_Pos': n_pos, 'Mean_Pos': mean_pos, 'SD_Pos': sd_pos, 'CV_Pos': cv_pos,
+        'N_Neg': n_neg, 'Mean_Neg': mean_neg, 'SD_Neg': sd_neg, 'CV_Neg': cv_neg,
+        'S_B': s_b, 'Z_Prime': z_prime, 'QC_Pass': status.tolist(),
+    }
+
+
+def _fmt(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    return '' if np.isnan(value) else f"{value:.4f}"
+
+
+def write_qc(dir_path, columns):
+    """Write the QC table of a subdirectory to plate_qc.csv. Returns the path or '' on error."""
+    path = os.path.join(dir_path, QC_FILENAME)
+    try:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(QC_COLUMNS)
+            for row in zip(*(columns[name] for name in QC_COLUMNS)):
+                writer.writerow([_fmt(v) for v in row])
+    except OSError as e:
+        logger.error("Nie udało się zapisać %s: %s", path, e)
+        return ''
+    logger.info("Zapisano dane do %s", path)
+    return path
+
+
+def run_dir_qc(dir_path, settings):
+    """Compute and write plate QC of one data subdirectory. Returns the QC file path or ''."""
+    # data_analyser imports this module (QC exclusion), so it is imported here
+    import data_analyser
+
+    tables, files = [], []
+    for path in data_analyser.find_raw_files(dir_path):
+        try:
+            table = read_table(path)
+        except Exception as e:
+            logger.error("Nie udało się wczytać %s: %s", path, e)
+            continue
+        if not len(table) or not {'Sample', 'Plate', 'Measurement'} <= set(table.columns):
+            continue
+        tables.append(table)
+        files.extend([os.path.basename(path)] * len(table))
+    if not tables:
+        return ''
+    columns = qc_columns(MeasurementTable.concat(tables), files, settings)
+
+    status = list(zip(columns['Plate'], columns['QC_Pass']))
+    undetermined = sorted({plate for plate, ok in status if ok == NOT_DETERMINED})
+    if undetermined:
+        logger.warning("Za mało studzienek kontrolnych (co najmniej 2 na kontrolę) do oceny QC płytek w %s: %s",
+                       dir_path, undetermined)
+    failed = sorted({plate for plate, ok in status if ok == 'no'})
+    if failed:
+        logger.warning("Płytki w %s niespełniające kryteriów QC (Z' >= %s%s): %s", dir_path,
+                       settings.get('min_z_prime', 0.5),
+                       f", CV <= {settings['max_cv']}%" if settings.get('max_cv') is not None else '', failed)
+    return write_qc(dir_path, columns)
+
+
+def run_qc(output_paths, config=None):
+    """
+    Plate QC of every data subdirectory containing one of output_paths (files written by
+    data_generator). config – analysis configuration (as in analysis_config.resolve_config);
+    nothing is done when its 'qc' key is not set. Returns the list of written QC files.
+    """
+    settings = analysis_config.resolve_config(config)['qc']
+    if not settings:
+        return []
+    written = []
+    for dir_path in sorted({os.path.dirname(path) for path in output_paths}):
+        path = run_dir_qc(dir_path, settings)
+        if path:
+            written.append(path)
+    return written
+
+
+def failed_files(dir_path):
+    """Names of plate files of a subdirectory that failed QC according to its plate_qc.csv (empty set if none)."""
+    path = os.path.join(dir_path, QC_FILENAME)
+    if not os.path.exists(path):
+        return set()
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            return {row['File'] for row in csv.DictReader(f) if row.get('QC_Pass') == 'no'}
+    except (OSError, KeyError) as e:
+        logger.error("Nie udało się wczytać %s: %s", path, e)
+        return set()
@@ -3,6 +3,7 @@ from tkinter import ttk, messagebox, filedialog
 from itertools import product
 import csv
 import os
+import plate_geometry
 from logger_setup import logger
 
 MAPPING_DIR = 'mappings'
@@ -66,6 +67,23 @@ class SampleMapperGenerator:
         self.sort_button = ttk.Button(sort_frame, text='Sortuj', command=self.sort_names, state='disabled')
         self.sort_button.pack(side='left', padx=(5, 0))
 
+        # -----------------------
+        # Format płytki dla nowego mappingu
+        # -----------------------
+        format_frame = ttk.Frame(self.root)
+        format_frame.pack(pady=(0, 5))
+
+        ttk.Label(format_frame, text="Format płytki:").pack(side='left', padx=(0, 5))
+        self.plate_format_var = tk.StringVar(value=str(plate_geometry.DEFAULT_FORMAT))
+        format_combo = ttk.Combobox(
+            format_frame,
+            textvariable=self.plate_format_var,
+            state='readonly',
+            values=[str(wells) for wells in plate_geometry.PLATE_FORMATS],
+            width=6
+        )
+        format_combo.pack(side='left')
+
         # -----------------------
         # Przycisk "Otwórz mapping" (wczytuje mapping i otwiera okno Mapowanie prób)
         # -----------------------
@@ -309,6 +327,8 @@ class SampleMapperGenerator:
 
         # Parsujemy nagłówek: ['', '01','02',...,'12']
         header = rows[0][1:]  # ['01','02',...,'12']
+        n_columns = sum(1 for c in header if c.strip())
+        geometry = plate_geometry.geometry_for_columns(n_columns) or plate_geometry.DEFAULT_GEOMETRY
 
         loaded_mapping = {}
         loaded_names = set()
@@ -344,7 +364,7 @@ class SampleMapperGenerator:
             self.sort_button.config(state='normal')
 
         # Otwórz okno mapowania z wczytanym mappingiem
-        MappingWindow(self.names, self.variants_tuples, loaded_mapping)
+        MappingWindow(self.names, self.variants_tuples, loaded_mapping, geometry)
 
     def create_mapping(self):
         """
@@ -353,7 +373,8 @@ class SampleMapperGenerator:
         if not self.names:
             messagebox.showerror('Błąd', 'Brak nazw do mapowania. Wygeneruj lub dodaj ręcznie.')
             return
-        MappingWindow(self.names, self.variants_tuples, {})
+        geometry = plate_geometry.geometry_for_format(int(self.plate_format_var.get()))
+        MappingWindow(self.names, self.variants_tuples, {}, geometry)
 
     def run(self):
         logger.info('Running SampleMapperGenerator GUI')
@@ -361,8 +382,10 @@ class SampleMapperGenerator:
 
 
 class MappingWindow:
-    def __init__(self, samples, variants_tuples, existing_mapping=None):
+    def __init__(self, samples, variants_tuples, existing_mapping=None, geometry=None):
         logger.info('Opening MappingWindow')
+        # Geometria płytki (96/384/1536 dołków)
+        self.geometry = geometry or plate_geometry.DEFAULT_GEOMETRY
         # Przechowujemy oryginalne kolejności
         self.original_samples = samples[:]
         self.original_tuples = variants_tuples[:]
@@ -413,20 +436,22 @@ class MappingWindow:
         self._build_sample_table()
 
         # -----------------------
-        # Tabela studzienek 8×12
+        # Tabela studzienek (8×12, 16×24 lub 32×48)
         # -----------------------
         grid_frame = ttk.Frame(self.top)
         grid_frame.grid(row=1, column=1, padx=5, pady=(0,10), sticky='ne')
 
-        wells_rows = 'ABCDEFGH'
-        wells_cols = [f'{i:02d}' for i in range(1, 13)]
+        wells_rows = self.geometry.rows
+        wells_cols = [f'{i:02d}' for i in range(1, self.geometry.columns + 1)]
+        # Przy gęstszych płytkach zmniejszamy przyciski, aby siatka zmieściła się w oknie
+        button_width = {12: 8, 24: 4}.get(self.geometry.columns, 2)
         for r_idx, r in enumerate(wells_rows):
             for c_idx, c in enumerate(wells_cols):
                 well = f'{r}{c}'
                 btn = tk.Button(
                     grid_frame,
                     text=well,
-                    width=8,
+                    width=button_width,
                     bg=self.default_bg,
                     command=lambda w=well: self.assign_sample(w)
                 )
@@ -585,10 +610,10 @@ class MappingWindow:
     def save_mapping(self):
         """
         Zapisuje mapping do CSV:
-        Nagłówek: puste + kolumny 01–12
-        Wiersze A–H z wartości lub pustym stringiem.
+        Nagłówek: puste + kolumny 01–12 (01–24 / 01–48 dla płytek 384 / 1536)
+        Wiersze A–H (A–P / A–AF) z wartości lub pustym stringiem.
         """
-        if len(self.mapping) != 96:
+        if len(self.mapping) != plate_geometry.well_count(self.geometry):
             if not messagebox.askyesno(
                 'Potwierdzenie',
                 'Nie wszystkie studzienki zmapowane. Czy kontynuować?'
@@ -604,8 +629,8 @@ class MappingWindow:
             return
 
         logger.info('Saving mapping to %s', filename)
-        rows = 'ABCDEFGH'
-        cols = [f'{i:02d}' for i in range(1, 13)]
+        rows = self.geometry.rows
+        cols = [f'{i:02d}' for i in range(1, self.geometry.columns + 1)]
 
         with open(filename, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
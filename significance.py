@@ -0,0 +1,264 @@
+"""
+Batched significance tests between samples of one timepoint.
+
+Tests are computed from the grouped statistics of the summary (N, Mean, Std of
+every sample per measurement or ratio), so all comparisons of a subdirectory
+are evaluated as whole arrays:
+- Welch's t-test for every requested pair of samples,
+- Welch's one-way ANOVA over all samples of each (Measurement, Denominator).
+
+P-values of the t-tests are corrected for multiple testing within each
+(Measurement, Denominator) family – Holm (default), Benjamini–Hochberg ('bh')
+or none. The t and F distribution tails use a NumPy regularized incomplete
+beta function (continued fraction), so SciPy is not needed.
+"""
+import math
+
+import numpy as np
+
+import analysis_config
+import columnar
+
+SIGNIFICANCE_FILENAME = 'significance.csv'
+# (upper bound of the adjusted p-value, marker); the first matching entry wins
+STAR_LEVELS = ((0.001, '***'), (0.01, '**'), (0.05, '*'))
+NOT_SIGNIFICANT = 'ns'
+
+BETACF_ITERATIONS = 300
+BETACF_EPSILON = 1e-15
+_TINY = 1e-300
+_LANCZOS_G = 7
+_LANCZOS_COEFFICIENTS = (
+    0.99999999999980993, 676.5203681218851, -1259.1392167224028, 771.32342877765313,
+    -176.61502916214059, 12.507343278686905, -0.13857109526572012,
+    9.9843695780195716e-6, 1.5056327351493116e-7,
+)
+
+
+def gammaln(x):
+    """Vectorized log-gamma of positive arguments (Lanczos approximation with reflection)."""
+    x = np.asarray(x, dtype=np.float64)
+    small = x < 0.5
+    z = np.where(small, 1.0 - x, x) - 1.0
+    series = np.full(z.shape, _LANCZOS_COEFFICIENTS[0])
+    for k, coefficient in enumerate(_LANCZOS_COEFFICIENTS[1:], start=1):
+        series = series + coefficient / (z + k)
+    t = z + _LANCZOS_G + 0.5
+    result = 0.5 * math.log(2 * math.pi) + (z + 0.5) * np.log(t) - t + np.log(series)
+    with np.errstate(divide='ignore'):
+        reflected = math.log(math.pi) - np.log(np.abs(np.sin(math.pi * x))) - result
+    return np.where(small, reflected, result)
+
+
+def _betacf(a, b, x):
+    """Continued fraction of the incomplete beta function (modified Lentz), for all elements at once."""
+    qab = a + b
+    qap = a + 1.0
+    qam = a - 1.0
+    c = np.ones_like(x)
+    d = 1.0 - qab * x / qap
+    d = 1.0 / np.where(np.abs(d) < _TINY, _TINY, d)
+    h = d.copy()
+    for m in range(1, BETACF_ITERATIONS + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / np.where(np.abs(d) < _TINY, _TINY, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < _TINY, _TINY, c)
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / np.where(np.abs(d) < _TINY, _TINY, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < _TINY, _TINY, c)
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1.0) < BETACF_EPSILON):
+            break
+    return h
+
+
+def betainc(a, b, x):
+    """Regularized incomplete beta function I_x(a, b), vectorized; NaN where an argument is NaN."""
+    a, b, x = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (a, b, x)))
+    result = np.full(x.shape, np.nan)
+    valid = (a > 0) & (b > 0) & (x >= 0) & (x <= 1)
+    result[valid & (x == 0)] = 0.0
+    result[valid & (x == 1)] = 1.0
+    inner = valid & (x > 0) & (x < 1)
+    if not inner.any():
+        return result
+    a, b, x = a[inner], b[inner], x[inner]
+    front = np.exp(gammaln(a + b) - gammaln(a) - gammaln(b) + a * np.log(x) + b * np.log1p(-x))
+    # The continued fraction converges fast for x < (a + 1) / (a + b + 2); use the symmetry otherwise
+    direct = x < (a + 1.0) / (a + b + 2.0)
+    values = np.empty(x.shape)
+    values[direct] = front[direct] * _betacf(a[direct], b[direct], x[direct]) / a[direct]
+    flip = ~direct
+    values[flip] = 1.0 - front[flip] * _betacf(b[flip], a[flip], 1.0 - x[flip]) / b[flip]
+    result[inner] = values
+    return result
+
+
+def t_sf_two_sided(t, df):
+    """Two-sided p-value of Student's t statistic with df degrees of freedom."""
+    t = np.asarray(t, dtype=np.float64)
+    df = np.asarray(df, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def f_sf(f, df1, df2):
+    """Upper tail probability of the F distribution."""
+    f = np.asarray(f, dtype=np.float64)
+    df1 = np.asarray(df1, dtype=np.float64)
+    df2 = np.asarray(df2, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return betainc(df2 / 2.0, df1 / 2.0, df2 / (df2 + df1 * f))
+
+
+def welch_t(n1, mean1, var1, n2, mean2, var2):
+    """Welch's t statistic, Welch–Satterthwaite degrees of freedom and two-sided p-value (arrays)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        se1 = var1 / n1
+        se2 = var2 / n2
+        t = (mean1 - mean2) / np.sqrt(se1 + se2)
+        df = (se1 + se2) ** 2 / (se1 * se1 / (n1 - 1) + se2 * se2 / (n2 - 1))
+    return t, df, t_sf_two_sided(t, df)
+
+
+def welch_anova(family, n, mean, var, n_families):
+    """
+    Welch's one-way ANOVA of the groups of every family at once (bincount over family codes).
+    Groups need n >= 2 and a positive variance. Returns (F, df1, df2, p) arrays of length n_families.
+    """
+    usable = (n >= 2) & (var > 0)
+    family, n, mean, var = family[usable], n[usable], mean[usable], var[usable]
+    w = n / var
+    k = np.bincount(family, minlength=n_families).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w_sum = np.bincount(family, weights=w, minlength=n_families)
+        grand = np.bincount(family, weights=w * mean, minlength=n_families) / w_sum
+        between = np.bincount(family, weights=w * (mean - grand[family]) ** 2, minlength=n_families) / (k - 1)
+        tmp = np.bincount(family, weights=(1 - w / w_sum[family]) ** 2 / (n - 1), minlength=n_families)
+        f = between / (1 + 2 * (k - 2) / (k * k - 1) * tmp)
+        df1 = k - 1
+        df2 = (k * k - 1) / (3 * tmp)
+    f[k < 2] = np.nan
+    return f, df1, df2, f_sf(f, df1, df2)
+
+
+def adjust_pvalues(p, family, method='holm'):
+    """
+    Multiple-testing correction of p-values within each family code (NaN p-values are left out).
+    method – 'holm' (step-down, family-wise error), 'bh' (Benjamini–Hochberg, FDR) or 'none'.
+    """
+    p = np.asarray(p, dtype=np.float64)
+    adjusted = p.copy()
+    if method == 'none':
+        return adjusted
+    tested = np.flatnonzero(~np.isnan(p))
+    if not tested.size:
+        return adjusted
+    family = np.asarray(family, dtype=np.intp)[tested]
+    order = np.lexsort((p[tested], family))
+    sorted_p = p[tested][order]
+    sorted_family = family[order]
+    size = np.bincount(sorted_family)[sorted_family]
+    start = np.r_[0, np.flatnonzero(sorted_family[1:] != sorted_family[:-1]) + 1]
+    rank = np.arange(len(sorted_p)) - np.repeat(start, np.diff(np.r_[start, len(sorted_p)]))
+
+    # Offsets of 2 per family keep the running max/min inside each family (adjusted values are in [0, 1])
+    offset = 2.0 * sorted_family
+    if method == 'holm':
+        values = np.minimum((size - rank) * sorted_p, 1.0)
+        values = np.maximum.accumulate(values + offset) - offset
+    else:
+        values = np.minimum(sorted_p * size / (rank + 1), 1.0)
+        values = (np.minimum.accumulate((values + offset)[::-1]) - offset[::-1])[::-1]
+    adjusted[tested[order]] = values
+    return adjusted
+
+
+def stars(p):
+    """Significance markers for adjusted p-values ('***', '**', '*', 'ns'; '' for NaN)."""
+    p = np.asarray(p, dtype=np.float64)
+    markers = np.full(p.shape, NOT_SIGNIFICANT, dtype=object)
+    for level, marker in reversed(STAR_LEVELS):
+        markers[p <= level] = marker
+    markers[np.isnan(p)] = ''
+    return markers
+
+
+def comparison_pairs(family, samples, comparisons):
+    """
+    Index pairs (first, second) of the groups to compare within each family.
+    comparisons – 'all' (every pair of samples of a family) or a list of (sample, sample) pairs.
+    """
+    family = np.asarray(family, dtype=np.intp)
+    order = np.argsort(family, kind='stable')
+    bounds = np.r_[0, np.flatnonzero(np.diff(family[order])) + 1, len(order)]
+    first, second = [], []
+    for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        members = order[lo:hi]
+        if comparisons == analysis_config.ALL_SAMPLE_PAIRS:
+            i, j = np.triu_indices(len(members), k=1)
+            first.append(members[i])
+            second.append(members[j])
+        else:
+            index = {samples[g]: g for g in members.tolist()}
+            pairs = [(index[a], index[b]) for a, b in comparisons if a in index and b in index]
+            if pairs:
+                first.append(np.array([a for a, _ in pairs], dtype=np.intp))
+                second.append(np.array([b for _, b in pairs], dtype=np.intp))
+    if not first:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def test_columns(summary, comparisons=analysis_config.ALL_SAMPLE_PAIRS, p_adjust='holm'):
+    """
+    Build the significance table from summary columns (data_analyser.write_summary input:
+    Subdir, Sample, Measurement, Denominator, N, Mean, Std as concatenated arrays/lists).
+    Returns {column name: column} with one row per t-test followed by one row per ANOVA
+    (ANOVA rows have empty samples, N_A = N_B = 0, and DF_Num/DF of the F statistic).
+    """
+    samples = list(summary['Sample'])
+    family_keys = list(zip(summary['Measurement'], summary['Denominator']))
+    family, families = columnar.factorize(family_keys)
+    family = family.astype(np.intp)
+    n = np.asarray(summary['N'], dtype=np.float64)
+    mean = np.asarray(summary['Mean'], dtype=np.float64)
+    var = np.asarray(summary['Std'], dtype=np.float64) ** 2
+    subdir = summary['Subdir'][0] if len(summary['Subdir']) else ''
+
+    first, second = comparison_pairs(family, samples, comparisons)
+    t, t_df, t_p = welch_t(n[first], mean[first], var[first], n[second], mean[second], var[second])
+    t_p[(n[first] < 2) | (n[second] < 2)] = np.nan
+    t_adjusted = adjust_pvalues(t_p, family[first], p_adjust)
+
+    f, df1, df2, f_p = welch_anova(family, n, mean, var, len(families))
+    anova = np.flatnonzero(~np.isnan(f))
+
+    n_tests = len(first)
+    n_rows = n_tests + len(anova)
+    test_family = np.r_[family[first], anova]
+    return {
+        'Subdir': [subdir] * n_rows,
+        'Measurement': [families[g][0] for g in test_family.tolist()],
+        'Denominator': [families[g][1] for g in test_family.tolist()],
+        'Test': ['Welch t'] * n_tests + ['Welch ANOVA'] * len(anova),
+        'Sample_A': [samples[g] for g in first.tolist()] + [''] * len(anova),
+        'Sample_B': [samples[g] for g in second.tolist()] + [''] * len(anova),
+        'N_A': np.r_[n[first], np.zeros(len(anova))].astype(np.int64),
+        'N_B': np.r_[n[second], np.zeros(len(anova))].astype(np.int64),
+        'Mean_A': np.r_[mean[first], np.full(len(anova), np.nan)],
+        'Mean_B': np.r_[mean[second], np.full(len(anova), np.nan)],
+        'Statistic': np.r_[t, f[anova]],
+        'DF_Num': np.r_[np.ones(n_tests), df1[anova]],
+        'DF': np.r_[t_df, df2[anova]],
+        'P': np.r_[t_p, f_p[anova]],
+        'P_Adjusted': np.r_[t_adjusted, f_p[anova]],
+        'Significance': list(stars(np.r_[t_adjusted, f_p[anova]])),
+    }
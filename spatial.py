@@ -0,0 +1,125 @@
+"""
+Plate spatial-bias correction (row/column effects).
+
+Every (Plate, Measurement) of a table is rebuilt as a rows x columns grid from
+the Row and Column columns of the generator output, giving a
+(plates, rows, columns) cube with NaN for empty wells. Tukey's median polish
+runs on all grids at once (nanmedian along one axis per step) and splits each
+grid into overall + row effect + column effect + residual. The corrected value
+of a well is then:
+- 'median_polish' – overall + residual (row and column effects removed,
+  the plate level kept),
+- 'bscore' – residual divided by the plate's MAD (1.4826 * median |residual|),
+  the B-score of Brideau et al. (2003).
+"""
+import warnings
+
+import numpy as np
+
+import plate_geometry
+from logger_setup import logger
+
+GROUP_COLUMNS = ('Plate', 'Measurement')
+MAX_ITERATIONS = 10
+TOLERANCE = 1e-9  # relative to the largest |value| of a grid
+MAD_SCALE = 1.4826
+
+_ROW_INDEX = {label: i for i, label in enumerate(plate_geometry.row_labels(max(
+    rows for rows, _ in plate_geometry.PLATE_FORMATS.values())))}
+
+
+def median_polish(cube):
+    """
+    Median polish of every grid of a (plates, rows, columns) cube; NaN cells are ignored.
+    Returns (overall, row_effects, column_effects, residuals) with shapes
+    (plates,), (plates, rows), (plates, columns) and the cube's shape.
+    """
+    residuals = np.array(cube, dtype=np.float64)
+    n_plates, n_rows, n_columns = residuals.shape
+    overall = np.zeros(n_plates)
+    row_effects = np.zeros((n_plates, n_rows))
+    column_effects = np.zeros((n_plates, n_columns))
+    with np.errstate(invalid='ignore'):
+        scale = np.nanmax(np.abs(residuals), axis=(1, 2), initial=0.0)
+    tolerance = TOLERANCE * np.where(np.isfinite(scale), scale, 0.0)
+
+    with warnings.catch_warnings():
+        # Empty rows/columns (all NaN) are expected; their medians are treated as 0
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for _ in range(MAX_ITERATIONS):
+            row_medians = np.nan_to_num(np.nanmedian(residuals, axis=2))
+            residuals -= row_medians[:, :, None]
+            row_effects += row_medians
+            delta = np.median(column_effects, axis=1)
+            column_effects -= delta[:, None]
+            overall += delta
+
+            column_medians = np.nan_to_num(np.nanmedian(residuals, axis=1))
+            residuals -= column_medians[:, None, :]
+            column_effects += column_medians
+            delta = np.median(row_effects, axis=1)
+            row_effects -= delta[:, None]
+            overall += delta
+
+            change = np.maximum(np.abs(row_medians).max(axis=1, initial=0.0),
+                                np.abs(column_medians).max(axis=1, initial=0.0))
+            if np.all(change <= tolerance):
+                break
+    return overall, row_effects, column_effects, residuals
+
+
+def correct_cube(cube, method='median_polish'):
+    """Spatially corrected copy of a (plates, rows, columns) cube (see the module docstring for methods)."""
+    overall, _, _, residuals = median_polish(cube)
+    if method == 'median_polish':
+        return overall[:, None, None] + residuals
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mad = MAD_SCALE * np.nanmedian(np.abs(residuals), axis=(1, 2))
+    mad = np.where(mad > 0, mad, np.nan)[:, None, None]
+    # A grid without spread has no bias to score: B = 0
+    return np.where(np.isnan(mad), np.where(np.isnan(residuals), np.nan, 0.0), residuals / mad)
+
+
+def _grid_positions(table):
+    """Row and column index of every row of the table; None when a Row/Column label is not a plate position."""
+    try:
+        row_of_category = np.array([_ROW_INDEX[label] for label in table.categories('Row')], dtype=np.intp)
+        column_of_category = np.array([int(label) - 1 for label in table.categories('Column')], dtype=np.intp)
+    except (KeyError, ValueError):
+        return None
+    if (column_of_category < 0).any():
+        return None
+    rows = row_of_category[table.codes('Row')] if len(row_of_category) else np.zeros(0, dtype=np.intp)
+    columns = column_of_category[table.codes('Column')] if len(column_of_category) else np.zeros(0, dtype=np.intp)
+    return rows, columns
+
+
+def correct_table(table, method='median_polish', source=''):
+    """
+    Spatially correct Value of every (Plate, Measurement) of a table in one batch.
+    Returns a new MeasurementTable with corrected Value and the original values in Raw_Value
+    (kept when already present, e.g. after normalization); the table itself when
+    method is None or the Row/Column labels cannot be placed on a grid.
+    """
+    if not method or not len(table):
+        return table
+    positions = _grid_positions(table)
+    if positions is None:
+        logger.warning("Nieznane etykiety Row/Column w %s; pomijam korektę przestrzenną.", source)
+        return table
+    row_index, column_index = positions
+    plates, _ = table.group_index(*GROUP_COLUMNS)
+
+    # Smallest plate format holding every position
+    n_rows, n_columns = int(row_index.max()) + 1, int(column_index.max()) + 1
+    for format_rows, format_columns in sorted(plate_geometry.PLATE_FORMATS.values()):
+        if format_rows >= n_rows and format_columns >= n_columns:
+            n_rows, n_columns = format_rows, format_columns
+            break
+
+    cube = np.full((int(plates.max()) + 1, n_rows, n_columns), np.nan)
+    cube[plates, row_index, column_index] = table.value
+    corrected = correct_cube(cube, method)[plates, row_index, column_index]
+
+    return table.with_values(corrected)
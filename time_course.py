@@ -0,0 +1,193 @@
+"""
+Time courses across timepoint subdirectories of data/ (0h, 3h, 6h, ...).
+
+Subdirectory names are parsed into a numeric time axis (hours). The per-sample
+summaries computed by data_analyser (the full-precision columns of summary.csv,
+passed in memory, so neither the 4-decimal rounding of the CSV nor stale files
+on disk affect the result) are stacked into a dense (timepoint x sample x
+measurement) cube and kinetics statistics are computed for all series at once:
+- fold change of the mean vs the first timepoint (t0),
+- least-squares slope of the mean over time (per hour),
+- area under the mean curve (trapezoidal rule over the available timepoints).
+
+Ratios of the summary are separate series, identified by (Measurement, Denominator).
+"""
+import csv
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from logger_setup import logger
+
+TIME_COURSE_FILENAME = 'time_course.csv'
+KINETICS_FILENAME = 'kinetics.csv'
+
+# Unit suffix -> hours
+TIME_UNITS = {
+    '': 1.0, 'h': 1.0, 'hr': 1.0, 'hrs': 1.0, 'godz': 1.0,
+    'min': 1 / 60, 'm': 1 / 60,
+    's': 1 / 3600, 'sec': 1 / 3600,
+    'd': 24.0, 'day': 24.0, 'days': 24.0,
+}
+_TIME_PATTERN = re.compile(r'^\s*[tT]?(\d+(?:[.,]\d+)?)\s*([a-zA-Z]*)\s*$')
+
+# times – hours (sorted), subdirs – matching directory names, samples – list,
+# series – list of (Measurement, Denominator) tuples ('' denominator for plain measurements),
+# n/mean/sem – arrays of shape (timepoints, samples, series); NaN (or 0 for n) where absent.
+TimeCourse = namedtuple('TimeCourse', ['times', 'subdirs', 'samples', 'series', 'n', 'mean', 'sem'])
+
+
+def parse_timepoint(name):
+    """Parse a subdirectory name such as '0h', '30min', 't2', '1.5h' or '2d' into hours; None if not a time."""
+    match = _TIME_PATTERN.match(name)
+    if not match:
+        return None
+    unit = TIME_UNITS.get(match.group(2).lower())
+    if unit is None:
+        return None
+    return float(match.group(1).replace(',', '.')) * unit
+
+
+def build_cube(summaries):
+    """
+    Stack the summaries of timepoint subdirectories into a TimeCourse.
+    summaries – {subdirectory name: summary columns (Sample, Measurement, Denominator,
+    N, Mean, SEM; see data_analyser.summary_table)}; names that are not timepoints are ignored.
+    Returns None when fewer than two timepoints have summaries.
+    """
+    timepoints = sorted((hours, name) for name, hours in ((name, parse_timepoint(name)) for name in summaries)
+                        if hours is not None)
+    if len({hours for hours, _ in timepoints}) != len(timepoints):
+        logger.error("Kilka podkatalogów odpowiada temu samemu punktowi czasowemu: %s",
+                     [name for _, name in timepoints])
+        return None
+    if len(timepoints) < 2:
+        logger.info("Za mało punktów czasowych z podsumowaniami (%d); pomijam przebieg czasowy.", len(timepoints))
+        return None
+
+    samples, series = {}, {}
+    parts = []
+    for t, (_, name) in enumerate(timepoints):
+        summary = summaries[name]
+        s = np.array([samples.setdefault(sample, len(samples)) for sample in summary['Sample']], dtype=np.intp)
+        m = np.array([series.setdefault(key, len(series))
+                      for key in zip(summary['Measurement'], summary['Denominator'])], dtype=np.intp)
+        parts.append((np.full(len(s), t, dtype=np.intp), s, m, np.asarray(summary['N'], dtype=np.int64),
+                      np.asarray(summary['Mean'], dtype=np.float64), np.asarray(summary['SEM'], dtype=np.float64)))
+
+    shape = (len(timepoints), len(samples), len(series))
+    n = np.zeros(shape, dtype=np.int64)
+    mean = np.full(shape, np.nan)
+    sem = np.full(shape, np.nan)
+    t, s, m, counts, means, sems = (np.concatenate(column) for column in zip(*parts))
+    n[t, s, m] = counts
+    mean[t, s, m] = means
+    sem[t, s, m] = sems
+
+    return TimeCourse(
+        np.array([hours for hours, _ in timepoints]), [name for _, name in timepoints],
+        list(samples), list(series), n, mean, sem,
+    )
+
+
+def kinetics(cube):
+    """
+    Vectorized kinetics of every (sample, series) of the cube.
+    Returns a dict of arrays: 'fold_change' (timepoints x samples x series) and
+    'slope', 'auc', 'max_fold_change', 'n_timepoints' (samples x series).
+    """
+    times = cube.times[:, None, None]
+    present = ~np.isnan(cube.mean)
+    n_timepoints = present.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fold_change = cube.mean / cube.mean[0]
+
+        # Least-squares slope over the timepoints available for each series
+        w = present.astype(np.float64)
+        y = np.where(present, cube.mean, 0.0)
+        t_mean = (w * times).sum(axis=0) / n_timepoints
+        y_mean = (w * y).sum(axis=0) / n_timepoints
+        dt = (times - t_mean) * w
+        slope = (dt * (y - y_mean)).sum(axis=0) / (dt * dt).sum(axis=0)
+        slope[n_timepoints < 2] = np.nan
+
+        max_fold_change = np.nanmax(np.where(np.isnan(fold_change), -np.inf, fold_change), axis=0)
+        max_fold_change[np.isinf(max_fold_change)] = np.nan
+
+    # Trapezoidal AUC, joining consecutive available timepoints (gaps are bridged)
+    auc = np.zeros(cube.mean.shape[1:])
+    last_t = np.full(auc.shape, np.nan)
+    last_y = np.full(auc.shape, np.nan)
+    for t, values in zip(cube.times.tolist(), cube.mean):
+        has = ~np.isnan(values)
+        segment = has & ~np.isnan(last_y)
+        auc[segment] += (t - last_t[segment]) * (values[segment] + last_y[segment]) / 2
+        last_t[has] = t
+        last_y[has] = values[has]
+    auc[n_timepoints < 2] = np.nan
+
+    return {
+        'fold_change': fold_change,
+        'slope': slope,
+        'auc': auc,
+        'max_fold_change': max_fold_change,
+        'n_timepoints': n_timepoints,
+    }
+
+
+def _fmt(value):
+    return '' if np.isnan(value) else f"{value:.4f}"
+
+
+def write_time_course(data_dir, cube, stats):
+    """Write time_course.csv (long format) and kinetics.csv to data_dir. Returns the written paths."""
+    course_path = os.path.join(data_dir, TIME_COURSE_FILENAME)
+    kinetics_path = os.path.join(data_dir, KINETICS_FILENAME)
+
+    with open(course_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Sample', 'Measurement', 'Denominator', 'Subdir', 'Time_h', 'N', 'Mean', 'SEM',
+                         'Fold_Change'])
+        t_idx, s_idx, m_idx = np.nonzero(~np.isnan(cube.mean))
+        order = np.lexsort((t_idx, m_idx, s_idx))
+        for t, s, m in zip(t_idx[order].tolist(), s_idx[order].tolist(), m_idx[order].tolist()):
+            measurement, denominator = cube.series[m]
+            writer.writerow([
+                cube.samples[s], measurement, denominator, cube.subdirs[t], f"{cube.times[t]:g}",
+                int(cube.n[t, s, m]), _fmt(cube.mean[t, s, m]), _fmt(cube.sem[t, s, m]),
+                _fmt(stats['fold_change'][t, s, m]),
+            ])
+    logger.info("Zapisano dane do %s", course_path)
+
+    with open(kinetics_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Sample', 'Measurement', 'Denominator', 'N_Timepoints', 'T0_Mean', 'Slope_per_h', 'AUC',
+                         'Max_Fold_Change'])
+        for s, sample in enumerate(cube.samples):
+            for m, (measurement, denominator) in enumerate(cube.series):
+                if not stats['n_timepoints'][s, m]:
+                    continue
+                writer.writerow([
+                    sample, measurement, denominator, int(stats['n_timepoints'][s, m]),
+                    _fmt(cube.mean[0, s, m]), _fmt(stats['slope'][s, m]), _fmt(stats['auc'][s, m]),
+                    _fmt(stats['max_fold_change'][s, m]),
+                ])
+    logger.info("Zapisano dane do %s", kinetics_path)
+    return [course_path, kinetics_path]
+
+
+def analyze_time_course(data_dir, summaries):
+    """
+    Build the time-course cube from the in-memory summaries of the timepoint subdirectories
+    ({name: summary columns}, see build_cube) and write time_course.csv and kinetics.csv
+    to data_dir. Returns the list of written files.
+    """
+    cube = build_cube(summaries)
+    if cube is None:
+        return []
+    logger.info("Przebieg czasowy: punkty %s h, %d próbek, %d serii",
+                [f"{t:g}" for t in cube.times], len(cube.samples), len(cube.series))
+    return write_time_course(data_dir, cube, kinetics(cube))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tryb nasłuchu katalogu input/: każdy nowy (lub nadpisany) eksport z czytnika jest
+od razu przetwarzany przez data_generator, a następnie analizowany jest tylko
+podkatalog data/, do którego trafił wynik.
+
+Na Linuxie zmiany wykrywa inotify (przez ctypes, bez dodatkowych zależności);
+na innych systemach, lub gdy inotify jest niedostępne, katalog jest odpytywany cyklicznie.
+"""
+import csv
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import time
+
+import archive_io
+import data_analyser
+import data_generator
+from logger_setup import logger
+
+INPUT_DIR = 'input'
+RULES_FILE = os.path.join(data_generator.MAPPING_DIR, 'watch_rules.csv')
+INPUT_SUFFIXES = ('.csv', '.csv.gz', '.csv.zst')
+POLL_INTERVAL = 2.0  # s – odstęp odpytywania w trybie bez inotify
+SETTLE_TIME = 1.0  # s – ile czekać na kolejne zmiany, zanim partia plików zostanie przetworzona
+
+# Stałe z <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def load_rules(path: str = RULES_FILE) -> list:
+    """
+    Wczytuje reguły przypisania mapowań dla plików spoza assignment.csv.
+    Format (średniki, UTF-8): wzorzec;plik_mapowania, np. "0h/1_*.csv;mappings/Mapping_nieparzyste.csv".
+    Wzorzec (fnmatch) dopasowywany jest do ścieżki względem input/ oraz do samej nazwy pliku.
+    """
+    rules = []
+    if not os.path.exists(path):
+        return rules
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        for idx, row in enumerate(csv.reader(f, delimiter=';'), start=1):
+            if len(row) < 2 or not row[0].strip() or row[0].strip().startswith('#'):
+                continue
+            if idx == 1 and row[0].strip() == 'pattern':
+                continue  # nagłówek
+            rules.append((row[0].strip(), os.path.normpath(row[1].strip())))
+    logger.debug('Wczytano %d reguł mapowania z %s', len(rules), path)
+    return rules
+
+
+def resolve_mapping(input_file: str, assignments: list, rules: list) -> str:
+    """
+    Zwraca plik mapowania dla pliku wejściowego: najpierw z assignment.csv,
+    potem z pierwszej pasującej reguły; pusty string, gdy nic nie pasuje.
+    """
+    input_norm = os.path.normpath(input_file)
+    for infile, mapfile in assignments:
+        if os.path.normpath(infile) == input_norm:
+            return mapfile
+
+    rel = os.path.relpath(input_norm, INPUT_DIR).replace(os.sep, '/')
+    name = os.path.basename(input_norm)
+    for pattern, mapfile in rules:
+        if fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(name, pattern):
+            return mapfile
+    return ''
+
+
+class PollingWatcher:
+    """Wykrywa nowe i zmienione pliki przez porównywanie (mtime, rozmiar) co interval sekund."""
+
+    def __init__(self, root: str, interval: float = POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict:
+        state = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for fname in filenames:
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def poll(self, timeout: float) -> set:
+        """Czeka do timeout sekund i zwraca zbiór ścieżek, które pojawiły się lub zmieniły."""
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        changed = {p for p, sig in current.items() if self.snapshot.get(p) != sig}
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Wykrywa zamknięte po zapisie i przeniesione pliki przez inotify (rekurencyjnie, także w nowych katalogach)."""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, root: str):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 nie powiodło się')
+        self.watches = {}
+        for dirpath, _, _ in os.walk(root):
+            self._add_watch(dirpath)
+
+    def _add_watch(self, path: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            logger.warning('Nie udało się obserwować katalogu %s (errno %d)', path, ctypes.get_errno())
+            return
+        self.watches[wd] = path
+
+    def poll(self, timeout: float) -> set:
+        """Czeka do timeout sekund na zdarzenia i zwraca zbiór zmienionych plików."""
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            parent = self.watches.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Nowy katalog (np. kolejny punkt czasowy): obserwuj go i zgłoś pliki już w nim obecne
+                    for dirpath, _, filenames in os.walk(path):
+                        self._add_watch(dirpath)
+                        changed.update(os.path.join(dirpath, f) for f in filenames)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(root: str, use_inotify: bool = True):
+    """Zwraca InotifyWatcher na Linuxie (gdy dostępny), w przeciwnym razie PollingWatcher."""
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(root)
+            logger.info('Nasłuch katalogu %s przez inotify', root)
+            return watcher
+        except (OSError, AttributeError) as e:
+            logger.warning('inotify niedostępne (%s); przechodzę na odpytywanie katalogu.', e)
+    logger.info('Nasłuch katalogu %s przez odpytywanie co %.1f s', root, POLL_INTERVAL)
+    return PollingWatcher(root)
+
+
+def process_files(paths, ratios=None) -> list:
+    """
+    Generuje dane dla podanych plików wejściowych i analizuje tylko te podkatalogi data/,
+    do których trafiły wyniki. Archiwa zip są rozwijane do zawartych w nich eksportów.
+    Analiza nigdy nie pyta użytkownika: ratios=None oznacza ustawienia z configs/analysis.json.
+    Zwraca listę wygenerowanych plików.
+    """
+    assignments = data_generator.load_assignments()
+    rules = load_rules()
+    expanded = []
+    for path in paths:
+        if path.lower().endswith(archive_io.ARCHIVE_SUFFIXES):
+            try:
+                expanded.extend(archive_io.list_members(path, INPUT_SUFFIXES))
+            except Exception as e:
+                logger.error('Nie udało się odczytać archiwum %s: %s', path, e)
+        else:
+            expanded.append(path)
+
+    pairs = []
+    for path in sorted(expanded):
+        if not path.lower().endswith(INPUT_SUFFIXES):
+            continue
+        mapfile = resolve_mapping(path, assignments, rules)
+        if not mapfile:
+            logger.warning('Brak mapowania dla %s (assignment.csv ani %s); pomijam.', path, RULES_FILE)
+            continue
+        pairs.append((os.path.normpath(path), mapfile))
+    if not pairs:
+        return []
+
+    errors = {}
+    outputs = data_generator.generate_pairs(pairs, errors=errors)
+    for infile, error in errors.items():
+        logger.error('Nie przetworzono %s: %s', infile, error)
+
+    affected = set()
+    for out in outputs:
+        rel_dir = os.path.relpath(os.path.dirname(out), data_generator.DATA_DIR)
+        if rel_dir == os.curdir:
+            logger.info('Plik %s nie leży w podkatalogu %s; pomijam analizę.', out, data_generator.DATA_DIR)
+            continue
+        affected.add(rel_dir.split(os.sep)[0])
+    if affected:
+        logger.info('Analiza podkatalogów: %s', sorted(affected))
+        data_analyser.analyze_all(subdirs=sorted(affected), ratios=ratios, interactive=False)
+    return outputs
+
+
+def watch(input_dir: str = INPUT_DIR, ratios=None, use_inotify: bool = True, settle: float = SETTLE_TIME):
+    """
+    Główna pętla nasłuchu: zbiera zmienione pliki, czeka settle sekund ciszy
+    (aby czytnik zdążył dokończyć zapis) i przetwarza całą partię. Kończy się Ctrl+C.
+    ratios – jak w data_analyser.analyze_all (False: bez ratios.csv, (licznik, mianownik): z ratios.csv,
+    None: wg konfiguracji analizy).
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    watcher = make_watcher(input_dir, use_inotify)
+    pending = set()
+    print(f'Nasłuchuję katalogu {input_dir} (Ctrl+C kończy)...')
+    try:
+        while True:
+            changed = watcher.poll(settle if pending else POLL_INTERVAL)
+            if changed:
+                pending.update(changed)
+                continue
+            if pending:
+                batch, pending = pending, set()
+                logger.info('Nowe pliki w %s: %s', input_dir, sorted(batch))
+                try:
+                    process_files(batch, ratios)
+                except Exception as e:
+                    logger.exception('Błąd podczas przetwarzania plików %s: %s', sorted(batch), e)
+    except KeyboardInterrupt:
+        print('Zakończono nasłuch.')
+    finally:
+        watcher.close()
+
+
+if __name__ == '__main__':
+    watch()